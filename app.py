@@ -1,17 +1,31 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
 import json
 
-# Import backend modules
+# Import backend modules (cheap: models, LLM clients and index load on first
+# use or in warmup(); run check_startup.py for an import-time breakdown)
+import chunk_store
+import compaction  # registers the compaction dry-run job handler
 import ingest
-import ingest_helper
+import index_coordinator  # registers the upload/delete/rebuild job handlers
+import job_queue
+import llm
 import qa
 import quiz
 import summarize
 import flashcards
 import mindmap
 import tts
+import embedding_service
+import query_cache
+import retrieval
+import vector_store
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 app = Flask(__name__, static_folder='static')
 CORS(app)
@@ -27,11 +41,17 @@ def upload_files():
     if 'files' not in request.files:
         return jsonify({'error': 'No files provided'}), 400
     
-    import threading
     import sqlite3
     
+    # Course / workspace the files are indexed in
+    collection = request.form.get('collection') or vector_store.DEFAULT_COLLECTION
+    try:
+        vector_store.check_collection_name(collection)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     files = request.files.getlist('files')
-    temp_files = []
+    temp_paths = []
     saved_files = []
     
     # Get existing files to check for duplicates
@@ -40,6 +60,9 @@ def upload_files():
     cursor = conn.cursor()
     cursor.execute('SELECT filename FROM uploads')
     existing_files = set(row[0] for row in cursor.fetchall())
+    existing_hashes = ingest.upload_hashes(cursor)
+    duplicates = []
+    bytes_saved = 0
     
     # Save uploaded files to disk AND add to database immediately
     for file in files:
@@ -48,63 +71,70 @@ def upload_files():
             if file.filename in existing_files:
                 print(f"Skipping duplicate: {file.filename}")
                 continue
+            
+            # Skip a renamed copy of a stored file (same bytes)
+            content_hash = ingest.file_hash(file.stream)
+            if content_hash in existing_hashes:
+                size = file.stream.seek(0, os.SEEK_END)
+                print(f"Skipping {file.filename}: same content as {existing_hashes[content_hash]}")
+                duplicates.append({'file': file.filename, 'duplicate_of': existing_hashes[content_hash]})
+                bytes_saved += size
+                continue
                 
             temp_path = os.path.join('data', 'temp', file.filename)
             os.makedirs(os.path.dirname(temp_path), exist_ok=True)
             file.save(temp_path)
             
             # Add to database immediately so it appears in list
-            cursor.execute('INSERT INTO uploads (filename) VALUES (?)', (file.filename,))
+            cursor.execute('INSERT INTO uploads (filename, content_hash, size_bytes, collection) VALUES (?, ?, ?, ?)',
+                           (file.filename, content_hash, os.path.getsize(temp_path), collection))
             saved_files.append(file.filename)
             existing_files.add(file.filename)
-            
-            # Create file-like object for background indexing
-            class TempFile:
-                def __init__(self, path):
-                    self.name = path
-            
-            temp_files.append(TempFile(temp_path))
+            existing_hashes[content_hash] = file.filename
+            temp_paths.append(temp_path)
     
     conn.commit()
     conn.close()
     
-    if not temp_files:
-        return jsonify({'error': 'No valid PDF files provided (may be duplicates)'}), 400
+    if not temp_paths:
+        return jsonify({'error': 'No valid PDF files provided (may be duplicates)',
+                        'duplicates': duplicates, 'bytes_saved': bytes_saved}), 400
     
-    # Index files in background (non-blocking)
-    def index_in_background():
-        try:
-            print(f"[Background] Starting indexing for {len(temp_files)} files...")
-            # Just do the embedding/indexing part, database already updated
-            result = ingest_helper.index_documents_only(temp_files)
-            print(f"[Background] {result}")
-        except Exception as e:
-            print(f"[Background] Indexing error: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    # Start background thread
-    index_thread = threading.Thread(target=index_in_background, daemon=True)
-    index_thread.start()
+    # Queue the embedding/indexing part (database already updated); a job
+    # worker picks it up, and it survives a restart
+    job_id = job_queue.enqueue('index_files', paths=temp_paths, collection=collection)
     
     # Return immediately
     return jsonify({
         'message': f'Uploaded {len(saved_files)} file(s). Indexing in background (~30-60s).',
         'files': saved_files,
+        'collection': collection,
+        'duplicates': duplicates,
+        'bytes_saved': bytes_saved,
+        'job_id': job_id,
         'note': 'Files will be searchable once indexing completes'
     })
 
 @app.route('/api/documents', methods=['GET'])
 def list_documents():
-    docs = ingest.get_uploaded_documents()
+    docs = ingest.get_uploaded_documents(request.args.get('collection'))
     return jsonify({'documents': docs})
 
+@app.route('/api/collections', methods=['GET'])
+def list_collections():
+    """Collections with their uploaded and indexed document counts"""
+    uploaded = ingest.get_collections()
+    indexed = chunk_store.get_collections()
+    return jsonify({'collections': [
+        {'name': name, 'documents': uploaded.get(name, 0), 'indexed_documents': indexed.get(name, 0)}
+        for name in sorted(set(uploaded) | set(indexed))
+    ]})
+
 @app.route('/api/documents/<path:filename>', methods=['DELETE'])
 def delete_document(filename):
-    """Delete an uploaded document and rebuild FAISS index in background"""
+    """Delete an uploaded document and remove its chunks from the FAISS index"""
     try:
         import sqlite3
-        import threading
         
         # Delete file from disk
         file_path = os.path.join('data', 'temp', filename)
@@ -112,6 +142,8 @@ def delete_document(filename):
             os.remove(file_path)
             print(f"Deleted file: {file_path}")
         
+        collection = ingest.get_document_collection(filename)
+        
         # Delete from database
         db_path = os.path.join('data', 'metadata.db')
         conn = sqlite3.connect(db_path)
@@ -121,29 +153,94 @@ def delete_document(filename):
         conn.close()
         print(f"Removed from database: {filename}")
         
-        # Rebuild FAISS index in background thread (non-blocking)
-        def rebuild_in_background():
-            try:
-                print(f"[Background] Starting FAISS rebuild after deleting {filename}...")
-                result = ingest.rebuild_faiss_index()
-                print(f"[Background] {result}")
-            except Exception as e:
-                print(f"[Background] FAISS rebuild error: {e}")
-        
-        # Start background thread
-        rebuild_thread = threading.Thread(target=rebuild_in_background, daemon=True)
-        rebuild_thread.start()
+        # Drop just this document's vectors in a background job (non-blocking)
+        job_id = job_queue.enqueue('delete_document', filename=filename, collection=collection)
         
-        # Return immediately (don't wait for rebuild)
+        # Return immediately
         return jsonify({
             'message': f'Document {filename} deleted successfully',
-            'note': 'Search index rebuilding in background (~30s)'
+            'job_id': job_id,
+            'note': 'Removing document from search index in background'
         })
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/index/rebuild', methods=['POST'])
+def rebuild_index():
+    """Repair operation: re-parse and re-embed every stored PDF (of one collection, if given)"""
+    collection = (request.get_json(silent=True) or {}).get('collection')
+    if collection:
+        try:
+            vector_store.check_collection_name(collection)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        job_id = job_queue.enqueue('rebuild_index', collection=collection)
+        return jsonify({'message': f'Index rebuild of {collection} started in background', 'job_id': job_id})
+    
+    # Every collection with uploads or an index (an emptied one gets its index cleared)
+    collections = sorted(set(ingest.get_collections()) | set(vector_store.list_collections())) \
+        or [vector_store.DEFAULT_COLLECTION]
+    job_ids = {name: job_queue.enqueue('rebuild_index', collection=name) for name in collections}
+    return jsonify({'message': 'Full index rebuild started in background', 'job_ids': job_ids})
+
+@app.route('/api/index/generations', methods=['GET'])
+def index_generations():
+    """Index generations on disk (newest first) with their manifests"""
+    collection = request.args.get('collection') or vector_store.DEFAULT_COLLECTION
+    try:
+        vector_store.check_collection_name(collection)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'collection': collection, 'generations': vector_store.list_generations(collection)})
+
+@app.route('/api/index/rollback', methods=['POST'])
+def rollback_index():
+    """Make an earlier index generation live again (the previous one unless 'generation' is given)"""
+    data = request.get_json(silent=True) or {}
+    collection = data.get('collection') or vector_store.DEFAULT_COLLECTION
+    try:
+        vector_store.check_collection_name(collection)
+        manifest = ingest.rollback_index(data.get('generation'), collection)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'message': f"Index of {collection} rolled back to generation {manifest.get('generation')}",
+        'generation': manifest.get('generation'),
+        'chunk_count': manifest.get('chunk_count'),
+        'documents': manifest.get('documents', []),
+        # Uploads the generation lacks are re-indexed, documents deleted since are removed again
+        'reindexing': manifest['reindexing'],
+        'removing': manifest['removing'],
+        'job_ids': manifest['job_ids']
+    })
+
+@app.route('/api/index/compact', methods=['POST'])
+def compact_index():
+    """Merge near-duplicate chunks; with dry_run, only report how much the index would shrink"""
+    data = request.json or {}
+    min_cosine = data.get('min_cosine')
+    collection = data.get('collection') or vector_store.DEFAULT_COLLECTION
+    try:
+        vector_store.check_collection_name(collection)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if data.get('dry_run'):
+        # O(N^2) over the index: run it in a job worker; the report is the job's result
+        job_id = job_queue.enqueue('compact_report', min_cosine=min_cosine, collection=collection)
+        return jsonify({'message': 'Compaction dry run started in background', 'job_id': job_id})
+    job_id = job_queue.enqueue('compact_index', min_cosine=min_cosine, collection=collection)
+    return jsonify({'message': 'Index compaction started in background', 'job_id': job_id})
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and result of a background job (upload, delete, rebuild, compaction or its dry run)"""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found'}), 404
+    return jsonify(job)
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     data = request.json
@@ -191,21 +288,11 @@ def chat():
                     context += f"{idx}. {title}\n{body}\nSource: {href}\n\n"
                 
                 # Use GitHub Models to answer based on web results
-                from openai import OpenAI
-                api_key = os.getenv("GITHUB_TOKEN")
-                
-                if not api_key:
+                if not llm.is_configured("github"):
                     return jsonify({'error': 'GitHub token not configured for web search'}), 500
                 
-                client = OpenAI(
-                    base_url="https://models.inference.ai.azure.com",
-                    api_key=api_key
-                )
-                
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": """You are a helpful assistant. Answer the user's question based on the provided web search results.
+                answer = llm.chat("github", [
+                    {"role": "system", "content": """You are a helpful assistant. Answer the user's question based on the provided web search results.
 
 Format your response with:
 - Clear paragraphs separated by blank lines
@@ -214,12 +301,8 @@ Format your response with:
 - Keep paragraphs concise (2-3 sentences)
 - DO NOT use numbered citations like [1], [2] etc.
 - Sources are shown separately, so don't list them in your answer"""},
-                        {"role": "user", "content": f"Question: {query}\n\n{context}\n\nProvide a clear, well-structured answer with proper paragraph breaks."}
-                    ],
-                    temperature=0.7
-                )
-                
-                answer = response.choices[0].message.content
+                    {"role": "user", "content": f"Question: {query}\n\n{context}\n\nProvide a clear, well-structured answer with proper paragraph breaks."}
+                ], temperature=0.7)
                 
                 # Just the answer - sources are displayed separately by frontend
                 formatted_answer = f"**Answer (from web):**\n\n{answer}"
@@ -256,7 +339,8 @@ def generate_quiz():
 def get_summary():
     data = request.json
     style = data.get('style', 'Bulleted')
-    result = summarize.get_summary(style)
+    selected_docs = data.get('documents', [])
+    result = summarize.get_summary(style, selected_docs)
     return jsonify({'summary': result})
 
 @app.route('/api/flashcards', methods=['POST'])
@@ -429,6 +513,13 @@ def get_knowledge_graph():
     return jsonify(result)
 
 
+@app.route('/api/embeddings/status', methods=['GET'])
+def embeddings_status():
+    """Report embedding model load time, memory footprint and query cache hits"""
+    stats = embedding_service.get_stats()
+    stats['query_cache'] = query_cache.get_stats()
+    return jsonify(stats)
+
 @app.route('/api/tts', methods=['POST'])
 def text_to_speech():
     data = request.json
@@ -447,4 +538,13 @@ def text_to_speech():
 
 if __name__ == '__main__':
     os.makedirs('data/temp', exist_ok=True)
+    # Load the embedding model once before serving so no request pays for it
+    warmup_started = time.perf_counter()
+    embedding_service.warmup()
+    retrieval.warm_query_cache()
+    print(f"[Startup] Imports {IMPORT_SECONDS:.2f}s, warmup {time.perf_counter() - warmup_started:.2f}s")
+    # The debug reloader also runs this block in its file-watcher process;
+    # only the serving process (WERKZEUG_RUN_MAIN) runs jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.start_workers()
     app.run(debug=True, port=5000)
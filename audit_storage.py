@@ -1,3 +1,4 @@
+import json
 import sqlite3
 import os
 
@@ -49,9 +50,60 @@ print("\n=== FAISS INDEX AUDIT ===")
 faiss_path = "data/faiss_index"
 if os.path.exists(faiss_path):
     print(f"FAISS index exists at {faiss_path}")
-    if os.path.exists(os.path.join(faiss_path, "index.faiss")):
+    current_file = os.path.join(faiss_path, "CURRENT")
+    if os.path.exists(current_file):
+        with open(current_file) as f:
+            generation = f.read().strip()
+        print(f"  ✓ CURRENT -> {generation}")
+        index_dir = os.path.join(faiss_path, generation)
+    else:
+        print("  ! no CURRENT pointer (flat layout, moved into a generation on next load)")
+        index_dir = faiss_path
+    if os.path.exists(os.path.join(index_dir, "index.faiss")):
         print("  ✓ index.faiss found")
-    if os.path.exists(os.path.join(faiss_path, "index.pkl")):
-        print("  ✓ index.pkl found")
+    if os.path.exists(os.path.join(index_dir, "ids.npy")):
+        print("  ✓ ids.npy found")
+    elif os.path.exists(os.path.join(index_dir, "index.pkl")):
+        print("  ! legacy index.pkl found (migrated to SQLite on next load)")
+    generations = sorted(d for d in os.listdir(faiss_path) if d.startswith("gen-") and not d.endswith(".tmp"))
+    print(f"  Generations on disk: {', '.join(generations) or 'none'}")
+    for generation in generations:
+        manifest_file = os.path.join(faiss_path, generation, "manifest.json")
+        if os.path.exists(manifest_file):
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+            # Generations record the chunks sharing a vector, which a rollback needs
+            restorable = os.path.exists(os.path.join(faiss_path, generation, "aliases.npy"))
+            print(f"  • {generation}: {manifest.get('chunk_count')} chunks, "
+                  f"{len(manifest.get('documents', []))} documents, built {manifest.get('built_at', '?')}"
+                  f"{' (restorable)' if restorable else ''}")
 else:
     print("FAISS index does not exist!")
+
+# Other collections' indexes (the default one is data/faiss_index)
+collections_dir = "data/collections"
+if os.path.isdir(collections_dir):
+    print("\nCollections:")
+    for name in sorted(os.listdir(collections_dir)):
+        current_file = os.path.join(collections_dir, name, "faiss_index", "CURRENT")
+        if os.path.exists(current_file):
+            with open(current_file) as f:
+                print(f"  • {name}: CURRENT -> {f.read().strip()}")
+        else:
+            print(f"  ! {name}: no published index")
+
+# Check deduplication
+print("\n=== DEDUPLICATION AUDIT ===")
+import chunk_store
+stats = chunk_store.dedup_stats()
+print(f"  Chunks: {stats['chunks']}, vectors: {stats['vectors']}")
+print(f"  Vectors saved by sharing identical chunks: {stats['vectors_saved']}")
+conn = sqlite3.connect(DB_PATH)
+cursor = conn.cursor()
+cursor.execute('PRAGMA table_info(uploads)')
+if 'content_hash' in {row[1] for row in cursor.fetchall()}:
+    cursor.execute('SELECT content_hash, COUNT(*) FROM uploads WHERE content_hash IS NOT NULL '
+                   'GROUP BY content_hash HAVING COUNT(*) > 1')
+    for content_hash, count in cursor.fetchall():
+        print(f"  ! {count} uploads share content {content_hash[:12]}")
+conn.close()
@@ -0,0 +1,31 @@
+import sys
+
+import chunk_store
+import embedding_service
+
+# Compare every backend against the sentence-transformers (torch) vectors
+# and measure encoder throughput on real chunks when there are some.
+backends = sys.argv[1:] or list(embedding_service.BACKENDS)
+
+texts = [doc.page_content for doc in chunk_store.get_documents_for_sources(chunk_store.get_indexed_filenames(), limit=256)]
+texts = [t for t in texts if t.strip()] or None
+
+print("\n=== Embedding Backend Parity (vs torch) ===")
+for backend in backends:
+    if backend == "torch":
+        continue
+    try:
+        report = embedding_service.check_parity(backend, texts[:64] if texts else None)
+        verdict = "compatible, no reindex needed" if report['compatible'] else "NOT compatible, rebuild the index"
+        print(f"  • {backend}: min cosine {report['min_cosine']}, mean {report['mean_cosine']} ({verdict})")
+    except Exception as e:
+        print(f"  • {backend}: unavailable ({e})")
+
+print("\n=== Embedding Throughput ===")
+for backend in backends:
+    try:
+        report = embedding_service.benchmark(backend, texts)
+        print(f"  • {backend}: {report['texts_per_second']} chunks/s, "
+              f"{report['query_latency_ms']} ms/query ({report['texts']} texts)")
+    except Exception as e:
+        print(f"  • {backend}: unavailable ({e})")
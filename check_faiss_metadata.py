@@ -1,17 +1,13 @@
 import os
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+import retrieval
+import vector_store
 
-DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
+vectorstore = vector_store.get_vectorstore()
 
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-if os.path.exists(FAISS_INDEX_PATH):
-    vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+if vectorstore is not None:
     
     # Get all documents
-    docs = vectorstore.similarity_search("test", k=50)
+    docs = retrieval.search("test", k=50, vectorstore=vectorstore, hybrid=False)
     
     # Extract unique source filenames
     sources = set()
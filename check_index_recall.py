@@ -0,0 +1,12 @@
+import vector_store
+import retrieval
+
+vectorstore = vector_store.get_vectorstore()
+
+if vectorstore is not None:
+    print("\n=== FAISS Index Recall (vs exact flat search) ===")
+    report = retrieval.measure_recall(k=10, num_queries=100, vectorstore=vectorstore)
+    for key, value in report.items():
+        print(f"  • {key}: {value}")
+else:
+    print("FAISS index not found!")
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+# Import the app in a fresh interpreter with -X importtime and show where
+# the time goes, per top-level package. The heavy dependencies (torch,
+# sentence-transformers, langchain_community, openai, groq, gTTS) should
+# not show up: they load on first use or in the warmup phase.
+module = sys.argv[1] if len(sys.argv) > 1 else "app"
+
+result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                        capture_output=True, text=True)
+if result.returncode != 0:
+    print(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    sys.exit(1)
+
+self_us = {}
+for line in result.stderr.splitlines():
+    if not line.startswith("import time:"):
+        continue
+    fields = line[len("import time:"):].split("|")
+    if len(fields) != 3 or not fields[0].strip().isdigit():
+        continue  # header
+    package = fields[2].strip().split(".")[0]
+    self_us[package] = self_us.get(package, 0) + int(fields[0])
+
+print(f"\n=== Import Time of {module}: {sum(self_us.values()) / 1e6:.2f}s ===")
+for package, us in sorted(self_us.items(), key=lambda item: -item[1])[:15]:
+    print(f"  • {package}: {us / 1000:.0f} ms")
@@ -0,0 +1,676 @@
+"""
+Chunk storage in data/metadata.db.
+
+Every chunk in the FAISS index has a row in the chunks table keyed by its
+docstore id, holding the source filename, page, text and metadata. The
+table doubles as the FAISS docstore (SQLiteDocstore), so loading an index
+no longer unpickles the whole corpus: chunk text is fetched lazily, only
+for the hits a search returns. It also lets a document be removed from the
+index by id instead of rebuilding the whole corpus.
+
+chunks_fts is an FTS5 index over the chunk text, kept in sync by triggers
+on every chunk write, for lexical (BM25) search next to the vector index.
+
+The documents table is the inverted index from filename to its chunks:
+one row per document with its chunk count and page range, also kept in
+sync by triggers, so resolving a document selection reads one row per
+document and its chunks come straight off the (filename, page) index
+instead of a scan over every chunk.
+
+Identical chunks share one vector: each row stores the sha1 of its text,
+and a chunk whose text is already in the index points at that chunk's
+vector (vector_id) instead of owning a FAISS row of its own. Searches map
+chunk ids to vector ids, and a hit lists the other places its text
+appears (get_references).
+
+Every chunk belongs to one collection (see vector_store): the chunks and
+documents tables carry its name, so lexical search and document lookups
+can be limited to the collections being searched.
+
+Chunks dropped by a new index generation are not deleted but moved to
+retired_chunks (retire_chunks) while a generation on disk may still refer
+to them, so rolling the index back can move them back (restore_chunk_set).
+A publish only moves the rows it drops; rows no generation refers to any
+more are purged (purge_retired).
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import uuid
+
+from langchain_core.documents import Document
+
+DATA_DIR = "data"
+DB_PATH = os.path.join(DATA_DIR, "metadata.db")
+
+DEFAULT_COLLECTION = "default"
+
+# SQLite caps the number of host parameters per statement
+_BATCH = 500
+
+
+def init_chunk_tables(cursor):
+    """Create the chunk table (called from ingest.init_db)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chunks (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            page INTEGER
+        )
+    ''')
+
+    # Columns added when the table became the docstore
+    cursor.execute('PRAGMA table_info(chunks)')
+    columns = {row[1] for row in cursor.fetchall()}
+    if 'content' not in columns:
+        cursor.execute('ALTER TABLE chunks ADD COLUMN content TEXT')
+    if 'metadata' not in columns:
+        cursor.execute('ALTER TABLE chunks ADD COLUMN metadata TEXT')
+    # Columns added for deduplication; NULL vector_id means the chunk owns its vector
+    if 'content_hash' not in columns:
+        cursor.execute('ALTER TABLE chunks ADD COLUMN content_hash TEXT')
+    if 'vector_id' not in columns:
+        cursor.execute('ALTER TABLE chunks ADD COLUMN vector_id TEXT')
+    # Column added for collections
+    if 'collection' not in columns:
+        cursor.execute(f"ALTER TABLE chunks ADD COLUMN collection TEXT NOT NULL DEFAULT '{DEFAULT_COLLECTION}'")
+    cursor.connection.create_function('chunk_hash', 1, content_hash, deterministic=True)
+    cursor.execute('UPDATE chunks SET content_hash = chunk_hash(content) WHERE content_hash IS NULL')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_filename ON chunks (filename)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_filename_page ON chunks (filename, page)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_content_hash ON chunks (content_hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_vector_id ON chunks (vector_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_collection ON chunks (collection, filename)')
+
+    _init_fts(cursor)
+    _init_documents(cursor)
+    _init_retired(cursor)
+
+
+def _init_fts(cursor):
+    """Full-text index over chunk text (skipped if SQLite lacks FTS5)."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'")
+    if cursor.fetchone():
+        return
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE chunks_fts USING fts5(
+                content, content='chunks', content_rowid='rowid', tokenize='porter unicode61'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"[ChunkStore] FTS5 unavailable, lexical search disabled: {e}")
+        return
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts (rowid, content) VALUES (new.rowid, new.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE OF content ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            INSERT INTO chunks_fts (rowid, content) VALUES (new.rowid, new.content);
+        END
+    ''')
+    # Index the chunks stored before the table existed
+    cursor.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+
+def _init_documents(cursor):
+    """Per-document summary of the chunks table, maintained by triggers."""
+    cursor.execute('PRAGMA table_info(documents)')
+    columns = {row[1] for row in cursor.fetchall()}
+    if 'collection' in columns:
+        return
+    if columns:
+        # Created before collections; it is derived data, so rebuild it
+        for trigger in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS chunks_documents_{trigger}')
+        cursor.execute('DROP TABLE documents')
+    cursor.execute('''
+        CREATE TABLE documents (
+            filename TEXT PRIMARY KEY,
+            collection TEXT NOT NULL,
+            chunks INTEGER NOT NULL DEFAULT 0,
+            first_page INTEGER,
+            last_page INTEGER
+        )
+    ''')
+
+    # min()/max() of a NULL page are NULL, hence the coalesce
+    add_chunk = '''
+        INSERT INTO documents (filename, collection, chunks, first_page, last_page)
+        VALUES (new.filename, new.collection, 1, new.page, new.page)
+        ON CONFLICT (filename) DO UPDATE SET
+            collection = excluded.collection,
+            chunks = chunks + 1,
+            first_page = coalesce(min(first_page, excluded.first_page), first_page, excluded.first_page),
+            last_page = coalesce(max(last_page, excluded.last_page), last_page, excluded.last_page);
+    '''
+    # The page range is recomputed off idx_chunks_filename_page
+    drop_chunk = '''
+        UPDATE documents SET
+            chunks = chunks - 1,
+            first_page = (SELECT MIN(page) FROM chunks WHERE filename = old.filename),
+            last_page = (SELECT MAX(page) FROM chunks WHERE filename = old.filename)
+        WHERE filename = old.filename;
+        DELETE FROM documents WHERE filename = old.filename AND chunks <= 0;
+    '''
+    cursor.execute(f'CREATE TRIGGER chunks_documents_insert AFTER INSERT ON chunks BEGIN {add_chunk} END')
+    cursor.execute(f'CREATE TRIGGER chunks_documents_delete AFTER DELETE ON chunks BEGIN {drop_chunk} END')
+    cursor.execute(f'''
+        CREATE TRIGGER chunks_documents_update AFTER UPDATE OF filename, page, collection ON chunks
+        BEGIN {drop_chunk} {add_chunk} END
+    ''')
+    # Index the chunks stored before the table existed
+    cursor.execute('''
+        INSERT INTO documents (filename, collection, chunks, first_page, last_page)
+        SELECT filename, MAX(collection), COUNT(*), MIN(page), MAX(page) FROM chunks GROUP BY filename
+    ''')
+
+
+def _init_retired(cursor):
+    """Same columns as chunks, for rows of superseded generations (no FTS or documents triggers)."""
+    cursor.execute('CREATE TABLE IF NOT EXISTS retired_chunks AS SELECT * FROM chunks WHERE 0')
+    retired = set(_chunk_columns(cursor, 'retired_chunks'))
+    for column in _chunk_columns(cursor):
+        if column not in retired:
+            cursor.execute(f'ALTER TABLE retired_chunks ADD COLUMN {column}')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_retired_chunks_id ON retired_chunks (id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_retired_chunks_collection ON retired_chunks (collection)')
+
+
+_schema_ready = False
+
+
+def _connect():
+    global _schema_ready
+    os.makedirs(DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH)
+    if not _schema_ready:
+        init_chunk_tables(conn.cursor())
+        conn.commit()
+        _schema_ready = True
+    return conn
+
+
+def _batches(items):
+    for i in range(0, len(items), _BATCH):
+        yield items[i:i + _BATCH]
+
+
+def source_filename(doc):
+    """Filename a chunk belongs to, as stored in the uploads table."""
+    return os.path.basename(doc.metadata.get('source', ''))
+
+
+def content_hash(text):
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def new_chunk_ids(splits):
+    return [uuid.uuid4().hex for _ in splits]
+
+
+def _row_to_document(content, metadata, chunk_id=None):
+    return Document(id=chunk_id, page_content=content or "", metadata=json.loads(metadata) if metadata else {})
+
+
+def save_chunks(docs_by_id, collection=DEFAULT_COLLECTION):
+    """Insert or replace chunks of a collection, given {chunk id: Document}."""
+    rows = [(chunk_id, source_filename(doc), doc.metadata.get('page'),
+             doc.page_content, json.dumps(doc.metadata), content_hash(doc.page_content), collection)
+            for chunk_id, doc in docs_by_id.items()]
+
+    conn = _connect()
+    cursor = conn.cursor()
+    # An upsert rather than INSERT OR REPLACE: REPLACE deletes without
+    # firing the delete trigger, which would leave stale text in chunks_fts
+    cursor.executemany('''
+        INSERT INTO chunks (id, filename, page, content, metadata, content_hash, collection)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            filename = excluded.filename, page = excluded.page,
+            content = excluded.content, metadata = excluded.metadata,
+            content_hash = excluded.content_hash, collection = excluded.collection
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+
+def get_documents(ids):
+    """Fetch chunks by id, in the given order; missing ids are skipped."""
+    found = {}
+    conn = _connect()
+    cursor = conn.cursor()
+    for batch in _batches(list(ids)):
+        placeholders = ",".join("?" * len(batch))
+        cursor.execute(f'SELECT id, content, metadata FROM chunks WHERE id IN ({placeholders})', batch)
+        for chunk_id, content, metadata in cursor.fetchall():
+            found[chunk_id] = _row_to_document(content, metadata, chunk_id)
+    conn.close()
+    return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+
+def get_chunk_ids(filename):
+    """Chunk ids of one document (exact stored filename), in page order."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM chunks WHERE filename = ? ORDER BY page, rowid', (filename,))
+    ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return ids
+
+
+def get_hashes(ids):
+    """{chunk id: content hash}"""
+    hashes = {}
+    conn = _connect()
+    cursor = conn.cursor()
+    for batch in _batches(list(ids)):
+        cursor.execute(f"SELECT id, content_hash FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+        hashes.update(cursor.fetchall())
+    conn.close()
+    return hashes
+
+
+def find_vector_owners(hashes):
+    """{content hash: [ids of chunks with that text that own a vector]}"""
+    owners = {}
+    conn = _connect()
+    cursor = conn.cursor()
+    for batch in _batches(list(set(hashes))):
+        cursor.execute(f'''
+            SELECT content_hash, id FROM chunks
+            WHERE vector_id IS NULL AND content_hash IN ({','.join('?' * len(batch))})
+            ORDER BY rowid
+        ''', batch)
+        for digest, chunk_id in cursor.fetchall():
+            owners.setdefault(digest, []).append(chunk_id)
+    conn.close()
+    return owners
+
+
+def get_aliases(vector_ids):
+    """{vector id: [ids of the chunks sharing it]} (owners with no aliases are left out)"""
+    aliases = {}
+    conn = _connect()
+    cursor = conn.cursor()
+    for batch in _batches(list(vector_ids)):
+        cursor.execute(f"SELECT vector_id, id FROM chunks WHERE vector_id IN ({','.join('?' * len(batch))}) "
+                       "ORDER BY rowid", batch)
+        for vector_id, chunk_id in cursor.fetchall():
+            aliases.setdefault(vector_id, []).append(chunk_id)
+    conn.close()
+    return aliases
+
+
+def set_vector_ids(vector_ids):
+    """Point chunks at the vector they share, given {chunk id: vector id or None (owns one)}."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.executemany('UPDATE chunks SET vector_id = ? WHERE id = ?',
+                       [(vector_id, chunk_id) for chunk_id, vector_id in vector_ids.items()])
+    conn.commit()
+    conn.close()
+
+
+def get_vector_ids_for_sources(filenames):
+    """Ids of the vectors that represent the chunks of these documents (exact stored filenames)."""
+    filenames = list(filenames)
+    if not filenames:
+        return []
+    conn = _connect()
+    cursor = conn.cursor()
+    vector_ids = []
+    for batch in _batches(filenames):
+        cursor.execute(f"SELECT coalesce(vector_id, id) FROM chunks WHERE filename IN ({','.join('?' * len(batch))}) "
+                       "ORDER BY filename, page, rowid", batch)
+        vector_ids.extend(row[0] for row in cursor.fetchall())
+    conn.close()
+    return list(dict.fromkeys(vector_ids))
+
+
+def get_references(vector_ids):
+    """{vector id: [{'source': filename, 'page': page}]} of the duplicates sharing each vector."""
+    references = {}
+    conn = _connect()
+    cursor = conn.cursor()
+    for batch in _batches(list(vector_ids)):
+        cursor.execute(f"SELECT vector_id, filename, page FROM chunks WHERE vector_id IN ({','.join('?' * len(batch))}) "
+                       "ORDER BY filename, page", batch)
+        for vector_id, filename, page in cursor.fetchall():
+            references.setdefault(vector_id, []).append({'source': filename, 'page': page})
+    conn.close()
+    return references
+
+
+def dedup_stats():
+    """Chunk rows, vectors they need, and vectors saved by sharing identical chunks."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*), COUNT(vector_id) FROM chunks')
+    total, shared = cursor.fetchone()
+    conn.close()
+    return {'chunks': total, 'vectors': total - shared, 'vectors_saved': shared}
+
+
+def get_document_index(filenames=None, collections=None):
+    """
+    {filename: {'collection': name, 'chunks': count, 'first_page': n, 'last_page': n}}
+    for the given stored filenames, or for every document (of the given collections).
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    sql = 'SELECT filename, collection, chunks, first_page, last_page FROM documents'
+    if filenames is None:
+        if collections is None:
+            cursor.execute(sql)
+        else:
+            collections = list(collections)
+            cursor.execute(f"{sql} WHERE collection IN ({','.join('?' * len(collections))})", collections)
+        rows = cursor.fetchall()
+    else:
+        rows = []
+        for batch in _batches(list(filenames)):
+            cursor.execute(f"{sql} WHERE filename IN ({','.join('?' * len(batch))})", batch)
+            rows.extend(row for row in cursor.fetchall() if collections is None or row[1] in collections)
+    conn.close()
+    return {filename: {'collection': collection, 'chunks': chunks, 'first_page': first_page, 'last_page': last_page}
+            for filename, collection, chunks, first_page, last_page in rows}
+
+
+def get_collections():
+    """{collection: number of documents} for every collection with indexed chunks."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT collection, COUNT(*) FROM documents GROUP BY collection ORDER BY collection')
+    collections = dict(cursor.fetchall())
+    conn.close()
+    return collections
+
+
+def resolve_sources(selection, collections=None, loose=False):
+    """
+    Stored filenames for a document selection from the frontend.
+
+    Filenames match exactly, ignoring case (a path matches by its file
+    name), so selecting notes.pdf never pulls in chem_notes.pdf. With
+    loose=True a selection may also be a fragment of the stored filename
+    (or the other way round); only topic extraction, which takes whatever
+    the user typed, uses that. collections limits the match to documents
+    of those collections.
+    """
+    selected = {os.path.basename(s.strip()).lower() for s in selection or () if s and s.strip()}
+    if not selected:
+        return []
+    stored = get_document_index(collections=collections)
+    matched = []
+    for filename in sorted(stored):
+        name = filename.lower()
+        if not name:
+            continue
+        if name in selected or (loose and any(sel in name or name in sel for sel in selected)):
+            matched.append(filename)
+    return matched
+
+
+def get_documents_for_sources(filenames, limit=None, collections=None, loose=False):
+    """Chunks of the selected documents (see resolve_sources), in page order."""
+    resolved = resolve_sources(filenames, collections, loose)
+    if not resolved:
+        return []
+
+    query = (f"SELECT content, metadata FROM chunks WHERE filename IN ({','.join('?' * len(resolved))}) "
+             "ORDER BY filename, page, rowid")
+    if limit:
+        query += f' LIMIT {int(limit)}'
+
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute(query, resolved)
+    docs = [_row_to_document(content, metadata) for content, metadata in cursor.fetchall()]
+    conn.close()
+    return docs
+
+
+def _match_expression(query):
+    """FTS5 query matching any term of free text (quoted, so operators are literal)."""
+    terms = dict.fromkeys(t.lower() for t in re.findall(r"\w+", query))
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def search_text(query, limit=20, filenames=None, collections=None):
+    """
+    Vector ids of the chunks ranked by BM25 relevance to query, best first
+    (duplicates of one text collapse into the vector they share).
+
+    Returns an empty list if the query has no searchable terms or SQLite
+    was built without FTS5.
+    """
+    expression = _match_expression(query)
+    if not expression:
+        return []
+
+    sql = '''
+        SELECT coalesce(chunks.vector_id, chunks.id) FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid
+        WHERE chunks_fts MATCH ?
+    '''
+    params = [expression]
+    if filenames:
+        sql += f" AND chunks.filename IN ({','.join('?' * len(filenames))})"
+        params.extend(filenames)
+    if collections:
+        sql += f" AND chunks.collection IN ({','.join('?' * len(collections))})"
+        params.extend(collections)
+    sql += ' ORDER BY bm25(chunks_fts) LIMIT ?'
+    params.append(int(limit))
+
+    conn = _connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        ids = list(dict.fromkeys(row[0] for row in cursor.fetchall()))
+    except sqlite3.OperationalError as e:
+        print(f"[ChunkStore] Lexical search failed: {e}")
+        ids = []
+    conn.close()
+    return ids
+
+
+def get_indexed_filenames(collection=None):
+    conn = _connect()
+    cursor = conn.cursor()
+    if collection is None:
+        cursor.execute('SELECT filename FROM documents ORDER BY filename')
+    else:
+        cursor.execute('SELECT filename FROM documents WHERE collection = ? ORDER BY filename', (collection,))
+    filenames = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return filenames
+
+
+def forget_chunks(ids):
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.executemany('DELETE FROM chunks WHERE id = ?', [(chunk_id,) for chunk_id in ids])
+    conn.commit()
+    conn.close()
+
+
+def get_filenames(vector_ids):
+    """Sorted filenames of the chunks represented by these vectors."""
+    conn = _connect()
+    cursor = conn.cursor()
+    _load_ids(cursor, vector_ids)
+    cursor.execute('''
+        SELECT filename FROM chunks WHERE id IN (SELECT id FROM temp.selected_ids)
+        UNION SELECT filename FROM chunks WHERE vector_id IN (SELECT id FROM temp.selected_ids)
+        ORDER BY filename
+    ''')
+    filenames = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return filenames
+
+
+def _load_ids(cursor, ids):
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS selected_ids (id TEXT PRIMARY KEY)')
+    cursor.execute('DELETE FROM temp.selected_ids')
+    cursor.executemany('INSERT OR IGNORE INTO temp.selected_ids (id) VALUES (?)', [(i,) for i in ids])
+
+
+def _chunk_columns(cursor, table='chunks'):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return [row[1] for row in cursor.fetchall()]
+
+
+def retire_chunks(ids):
+    """
+    Take chunks out of the live tables, keeping their rows in retired_chunks
+    for generations that still refer to them (see restore_chunk_set).
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    columns = ', '.join(_chunk_columns(cursor))
+    _load_ids(cursor, ids)
+    cursor.execute('DELETE FROM retired_chunks WHERE id IN (SELECT id FROM temp.selected_ids)')
+    cursor.execute(f'INSERT INTO retired_chunks ({columns}) SELECT {columns} FROM chunks '
+                   'WHERE id IN (SELECT id FROM temp.selected_ids) ORDER BY rowid')
+    cursor.execute('DELETE FROM chunks WHERE id IN (SELECT id FROM temp.selected_ids)')
+    retired = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return retired
+
+
+def get_alias_map(collection=DEFAULT_COLLECTION):
+    """{chunk id: vector id} of a collection's chunks that share another chunk's vector."""
+    conn = _connect()
+    cursor = conn.cursor()
+    # vector_id > '' (rather than IS NOT NULL) lets SQLite walk idx_chunks_vector_id; aliases are few
+    cursor.execute("SELECT id, vector_id FROM chunks WHERE vector_id > '' AND +collection = ?", (collection,))
+    aliases = dict(cursor.fetchall())
+    conn.close()
+    return aliases
+
+
+def restore_chunk_set(live_vector_ids, vector_ids, aliases):
+    """
+    Make the chunk rows of an index generation live again, in one transaction.
+
+    live_vector_ids are the vectors of the generation being left;
+    vector_ids and aliases ({chunk id: vector id}) describe the one rolled
+    back to. Its chunks missing from the live tables come back from
+    retired_chunks, and live chunks it does not have are retired. Raises
+    ValueError, changing nothing, if some of its rows no longer exist.
+
+    Returns:
+        tuple: (chunks retired, chunks revived)
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    columns = ', '.join(_chunk_columns(cursor))
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS target_chunks (id TEXT PRIMARY KEY, vector_id TEXT)')
+    cursor.execute('DELETE FROM temp.target_chunks')
+    cursor.executemany('INSERT OR IGNORE INTO temp.target_chunks (id) VALUES (?)',
+                       [(chunk_id,) for chunk_id in vector_ids])
+    cursor.executemany('INSERT OR REPLACE INTO temp.target_chunks (id, vector_id) VALUES (?, ?)',
+                       list(aliases.items()))
+    cursor.execute('''
+        SELECT COUNT(*) FROM temp.target_chunks t
+        WHERE NOT EXISTS (SELECT 1 FROM chunks c WHERE c.id = t.id)
+          AND NOT EXISTS (SELECT 1 FROM retired_chunks r WHERE r.id = t.id)
+    ''')
+    missing = cursor.fetchone()[0]
+    if missing:
+        conn.close()
+        raise ValueError(f"{missing} chunks of that generation are no longer stored")
+
+    _load_ids(cursor, live_vector_ids)
+    leaving = ('(id IN (SELECT id FROM temp.selected_ids) OR vector_id IN (SELECT id FROM temp.selected_ids)) '
+               'AND id NOT IN (SELECT id FROM temp.target_chunks)')
+    cursor.execute(f'DELETE FROM retired_chunks WHERE id IN (SELECT id FROM chunks WHERE {leaving})')
+    cursor.execute(f'INSERT INTO retired_chunks ({columns}) SELECT {columns} FROM chunks '
+                   f'WHERE {leaving} ORDER BY rowid')
+    cursor.execute(f'DELETE FROM chunks WHERE {leaving}')
+    retired = cursor.rowcount
+
+    returning = 'id IN (SELECT id FROM temp.target_chunks) AND id NOT IN (SELECT id FROM chunks)'
+    cursor.execute(f'INSERT INTO chunks ({columns}) SELECT {columns} FROM retired_chunks '
+                   f'WHERE {returning} ORDER BY rowid')
+    revived = cursor.rowcount
+    cursor.execute('DELETE FROM retired_chunks WHERE id IN (SELECT id FROM temp.target_chunks) '
+                   'AND id IN (SELECT id FROM chunks)')
+    cursor.execute('''
+        UPDATE chunks SET vector_id = (SELECT t.vector_id FROM temp.target_chunks t WHERE t.id = chunks.id)
+        WHERE id IN (SELECT id FROM temp.target_chunks)
+    ''')
+    conn.commit()
+    conn.close()
+    return retired, revived
+
+
+def get_retired_ids(collection=DEFAULT_COLLECTION):
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM retired_chunks WHERE collection = ?', (collection,))
+    ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return ids
+
+
+def purge_retired(ids):
+    """Delete retired chunk rows for good (no generation on disk refers to them)."""
+    conn = _connect()
+    cursor = conn.cursor()
+    _load_ids(cursor, ids)
+    cursor.execute('DELETE FROM retired_chunks WHERE id IN (SELECT id FROM temp.selected_ids)')
+    purged = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return purged
+
+
+def __getattr__(name):
+    # SQLiteDocstore subclasses LangChain's docstore base classes, which are
+    # slow to import; the class is only built once an index is opened
+    if name == "SQLiteDocstore":
+        global SQLiteDocstore
+        SQLiteDocstore = _docstore_class()
+        return SQLiteDocstore
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _docstore_class():
+    from langchain_community.docstore.base import AddableMixin, Docstore
+
+    class SQLiteDocstore(Docstore, AddableMixin):
+        """LangChain docstore backed by the chunks table, read lazily per id"""
+
+        def __init__(self, collection=DEFAULT_COLLECTION):
+            self.collection = collection
+
+        def add(self, texts):
+            save_chunks(texts, self.collection)
+
+        def search(self, search):
+            docs = get_documents([search])
+            return docs[0] if docs else f"ID {search} not found."
+
+        def mget(self, ids):
+            return get_documents(ids)
+
+        def delete(self, ids):
+            forget_chunks(ids)
+
+    return SQLiteDocstore
@@ -1,10 +1,9 @@
 import os
 import sqlite3
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+import retrieval
+import vector_store
 
 DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
 DB_PATH = os.path.join(DATA_DIR, "metadata.db")
 
 def clean_duplicates():
@@ -50,12 +49,11 @@ def clean_duplicates():
     conn.close()
     
     print("\n=== Checking FAISS Index ===")
-    if os.path.exists(FAISS_INDEX_PATH):
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+    vectorstore = vector_store.get_vectorstore()
+    if vectorstore is not None:
         
         # Get all documents
-        docs = vectorstore.similarity_search("test", k=100)
+        docs = retrieval.search("test", k=100, vectorstore=vectorstore, hybrid=False)
         
         # Count by source
         source_counts = {}
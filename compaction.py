@@ -0,0 +1,130 @@
+"""
+Near-duplicate chunk compaction.
+
+Slide decks repeat headers, footers and boilerplate pages across files,
+which leaves many nearly identical vectors in the index that crowd the
+top k. find_near_duplicates() compares every vector with every earlier
+one (cosine similarity, in row blocks of COMPACT_BATCH) and assigns each
+chunk to the most similar earlier chunk it is at least COMPACT_MIN_COSINE
+similar to. This is O(N^2) work, and each block's similarity matrix is
+COMPACT_BATCH x N floats (about 200 MB at 50k vectors with the default
+batch) on top of a normalized copy of the vectors, so it only ever runs in
+a job worker, never in a web request. compact() then merges those chunks into
+the vector they duplicate, the same way exact duplicates share a vector
+(see chunk_store): their text stays in the chunk store, only the FAISS row
+goes.
+
+Both run as jobs queued by POST /api/index/compact: 'compact_index'
+merges, 'compact_report' is a dry run whose job result is report()'s
+summary of how much the index would shrink. Each
+collection is compacted on its own; chunks never merge across collections.
+"""
+
+import os
+
+import chunk_store
+import faiss_index
+import job_queue
+import vector_store
+
+# Cosine similarity at or above which two chunks count as the same text
+COMPACT_MIN_COSINE = float(os.getenv("COMPACT_MIN_COSINE", "0.97"))
+# Rows compared per block; peak memory is about COMPACT_BATCH x vectors x 4 bytes
+COMPACT_BATCH = int(os.getenv("COMPACT_BATCH", "1024"))
+_EXAMPLES = 10
+_EMPTY = {'vectors': 0, 'mergeable': 0, 'vectors_after': 0, 'shrink_percent': 0.0,
+          'bytes_saved': 0, 'min_cosine': COMPACT_MIN_COSINE}
+
+
+def find_near_duplicates(vectors, min_cosine=None, batch=None):
+    """
+    Greedy near-duplicate clustering of a vector matrix.
+
+    Returns {row: (row it merges into, similarity)}. A row only ever merges
+    into an earlier row that is itself kept, so merged rows never chain.
+    """
+    import numpy as np
+
+    min_cosine = COMPACT_MIN_COSINE if min_cosine is None else min_cosine
+    batch = batch or COMPACT_BATCH
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.maximum(norms, 1e-12)
+    kept = np.ones(len(unit), dtype=bool)
+    merges = {}
+
+    for start in range(0, len(unit), batch):
+        block = unit[start:start + batch] @ unit[:start + batch].T
+        # Only earlier rows are candidates
+        block[np.triu_indices(len(block), k=start, m=block.shape[1])] = -1.0
+        candidates = np.nonzero((block >= min_cosine).any(axis=1))[0]
+        for offset in candidates:
+            row = start + offset
+            similarities = np.where(kept[:row], block[offset, :row], -1.0)
+            target = int(similarities.argmax())
+            if similarities[target] >= min_cosine:
+                kept[row] = False
+                merges[row] = (target, float(similarities[target]))
+    return merges
+
+
+def _plan(vectorstore, min_cosine=None):
+    """{chunk id: (chunk id it merges into, similarity)} for the loaded index."""
+    # Live rows only (an HNSW index may still hold deleted ones)
+    rows = sorted(vectorstore.index_to_docstore_id)
+    ids = [vectorstore.index_to_docstore_id[pos] for pos in rows]
+    merges = find_near_duplicates(vector_store.stored_vectors(vectorstore)[rows], min_cosine)
+    return {ids[row]: (ids[target], similarity) for row, (target, similarity) in merges.items()}
+
+
+def _summary(vectorstore, plan, min_cosine=None):
+    vectors = len(vectorstore.index_to_docstore_id)
+    merged = len(plan)
+    return {
+        'vectors': vectors,
+        'mergeable': merged,
+        'vectors_after': vectors - merged,
+        'shrink_percent': round(100.0 * merged / vectors, 1) if vectors else 0.0,
+        'bytes_saved': faiss_index.bytes_per_vector(vectorstore.index) * merged,
+        'min_cosine': COMPACT_MIN_COSINE if min_cosine is None else min_cosine
+    }
+
+
+@job_queue.handler('compact_report')
+def report(min_cosine=None, collection=vector_store.DEFAULT_COLLECTION):
+    """Dry run: how much compaction would shrink a collection's live index, with example merges."""
+    vectorstore = vector_store.get_vectorstore(collection)
+    if vectorstore is None or vectorstore.index.ntotal == 0:
+        return dict(_EMPTY, examples=[])
+
+    plan = _plan(vectorstore, min_cosine)
+    examples = sorted(plan.items(), key=lambda item: -item[1][1])[:_EXAMPLES]
+    texts = {doc.id: doc for doc in chunk_store.get_documents(
+        [chunk_id for merged, (kept, _) in examples for chunk_id in (merged, kept)])}
+
+    result = _summary(vectorstore, plan, min_cosine)
+    result['examples'] = [
+        {
+            'similarity': round(similarity, 4),
+            'keep': {'source': chunk_store.source_filename(texts[kept]), 'text': texts[kept].page_content[:200]},
+            'merge': {'source': chunk_store.source_filename(texts[merged]), 'text': texts[merged].page_content[:200]}
+        }
+        for merged, (kept, similarity) in examples if merged in texts and kept in texts
+    ]
+    return result
+
+
+def compact(min_cosine=None, collection=vector_store.DEFAULT_COLLECTION):
+    """Merge near-duplicate chunks in a collection's index and publish a new generation."""
+    with vector_store.writer_lock(collection):
+        vectorstore = vector_store.load_vectorstore(collection=collection)
+        if vectorstore is None or vectorstore.index.ntotal == 0:
+            return dict(_EMPTY)
+        plan = _plan(vectorstore, min_cosine)
+        result = _summary(vectorstore, plan, min_cosine)
+        if plan:
+            vector_store.merge_rows(vectorstore, {merged: kept for merged, (kept, _) in plan.items()})
+    print(f"[Compaction] Merged {result['mergeable']} near-duplicate chunks in {collection} "
+          f"({result['vectors']} -> {result['vectors_after']} vectors)")
+    return result
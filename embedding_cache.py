@@ -0,0 +1,193 @@
+"""
+Persistent content-hash embedding cache.
+
+Chunk vectors are keyed by sha1(model variant + chunk text) and stored
+under data/embedding_cache/<model>/<backend>/ as a raw float32 matrix
+(vectors.f32) plus a line-per-row hash index (hashes.txt). The variant is
+the model plus the EMBEDDING_BACKEND that runs it (and, for onnx-int8, the
+quantized file), so vectors of one backend are never served to another. Both files are append-only, so a
+rebuild of an unchanged corpus only reads vectors back instead of running
+the encoder again.
+
+The vector file is memory-mapped read-only, not read into the process:
+only the rows a lookup asks for are paged in, however large the cache has
+grown. Appends go to the end of the file and the mapping is reopened over
+the longer file on the next lookup.
+
+Several processes (web workers, the job runner) may share a cache
+directory. Appends take an exclusive flock on its append.lock and first
+take in the rows other processes appended since, so every row is written
+after the last one on disk and the hash index stays aligned with it.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process server only
+    fcntl = None
+
+from embedding_service import (EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_INT8_FILE,
+                               get_embeddings)
+
+DATA_DIR = "data"
+CACHE_DIR = os.path.join(DATA_DIR, "embedding_cache")
+# A sha1 hex digest and its newline; hashes.txt rows are fixed-width
+_HASH_LINE = 41
+
+
+def backend_variant(backend=EMBEDDING_BACKEND):
+    """Name of a backend's numerics: onnx-int8 differs per quantized file."""
+    if backend == "onnx-int8":
+        return f"{backend}-{os.path.splitext(os.path.basename(EMBEDDING_ONNX_INT8_FILE))[0]}"
+    return backend
+
+
+def text_hash(text, model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND):
+    return hashlib.sha1(f"{model_name}\0{backend_variant(backend)}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Hash -> vector store for one embedding model run by one backend"""
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND, cache_dir=CACHE_DIR):
+        self.model_name = model_name
+        self.backend = backend
+        self.path = os.path.join(cache_dir, model_name.replace("/", "__"), backend_variant(backend))
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.hashes_path = os.path.join(self.path, "hashes.txt")
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.lock_path = os.path.join(self.path, "append.lock")
+        self.dim = None
+        self._rows = {}
+        self._count = 0
+        self._mapped = None
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        self._loaded = True
+        if not os.path.exists(self.meta_path):
+            return
+        with self._file_lock():
+            self._refresh()
+        print(f"[EmbeddingCache] Loaded {self._count} cached vectors for {self.model_name} ({self.backend})")
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the cache files, across processes."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            # Closing the file releases the flock
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _refresh(self):
+        """Take in the rows appended since this process last read the files (hold the file lock)."""
+        if self.dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        tail = b""
+        if os.path.exists(self.hashes_path):
+            with open(self.hashes_path, "rb") as f:
+                f.seek(self._count * _HASH_LINE)
+                tail = f.read()
+        hashes = tail[:len(tail) // _HASH_LINE * _HASH_LINE].decode().split()
+        hashes_size = self._count * _HASH_LINE + len(tail)
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        rows = min(self._count + len(hashes), size // (self.dim * 4))
+        if rows * _HASH_LINE != hashes_size or rows * self.dim * 4 != size:
+            # A crash between (or during) the two appends left one file longer; drop the tail
+            self._truncate(rows)
+        for offset, h in enumerate(hashes[:rows - self._count]):
+            self._rows[h] = self._count + offset
+        self._count = rows
+
+    def _truncate(self, rows):
+        for path, row_size in ((self.vectors_path, self.dim * 4), (self.hashes_path, _HASH_LINE)):
+            if os.path.exists(path):
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_size)
+
+    def _matrix(self):
+        """The cached vectors, memory-mapped read-only (remapped after appends)."""
+        if self._mapped is None or len(self._mapped) != self._count:
+            self._mapped = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                     shape=(self._count, self.dim))
+        return self._mapped
+
+    def _append(self, hashes, vectors):
+        """Append rows after the last one on disk (hold the file lock, refreshed)."""
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.meta_path, "w") as f:
+                json.dump({"model": self.model_name, "backend": backend_variant(self.backend), "dim": self.dim}, f)
+
+        start = self._count
+        with open(self.vectors_path, "ab") as f:
+            vectors.astype(np.float32).tofile(f)
+        with open(self.hashes_path, "a") as f:
+            f.write("".join(h + "\n" for h in hashes))
+
+        self._count += len(hashes)
+        for offset, h in enumerate(hashes):
+            self._rows[h] = start + offset
+
+    def embed_documents(self, texts, embed_fn):
+        """Return vectors for texts, calling embed_fn only for unseen ones."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+            hashes = [text_hash(t, self.model_name, self.backend) for t in texts]
+            missing = {}
+            for h, t in zip(hashes, texts):
+                if h not in self._rows and h not in missing:
+                    missing[h] = t
+
+            if missing:
+                new_vectors = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+                with self._file_lock():
+                    self._refresh()
+                    # Another process may have cached some of them while these were embedded
+                    keys = list(missing)
+                    fresh = [i for i, h in enumerate(keys) if h not in self._rows]
+                    self._append([keys[i] for i in fresh], new_vectors[fresh])
+
+            print(f"[EmbeddingCache] {len(texts) - len(missing)} cached, {len(missing)} embedded")
+            if not hashes:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            # Fancy indexing copies just these rows out of the mapping
+            return np.array(self._matrix()[[self._rows[h] for h in hashes]])
+
+    def size(self):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return len(self._rows)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+
+def embed_documents(texts):
+    """Embed chunk texts through the shared model, reusing cached vectors."""
+    return get_cache().embed_documents(texts, get_embeddings().embed_documents)
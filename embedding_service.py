@@ -0,0 +1,216 @@
+"""
+Shared embedding model service.
+
+The sentence-transformers model is loaded once per process and the same
+instance is handed to every module (qa, quiz, summarize, flashcards, mindmap,
+ingest), so request handlers never pay model construction cost.
+
+EMBEDDING_BACKEND picks how all-MiniLM-L6-v2 is run on CPU:
+    torch      - PyTorch (default)
+    onnx       - ONNX Runtime export of the same weights
+    onnx-int8  - ONNX Runtime with int8 dynamic quantization
+
+All three produce vectors in the same space, so switching backend does not
+require a reindex as long as check_parity() agrees (see
+check_embedding_backend.py, which also benchmarks throughput). The ONNX
+backends need `pip install "sentence-transformers[onnx]"`.
+"""
+
+import os
+import platform
+import threading
+import time
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# Quantized ONNX file shipped in the model repo; override for other CPUs
+# (e.g. onnx/model_qint8_avx512_vnni.onnx)
+EMBEDDING_ONNX_INT8_FILE = os.getenv(
+    "EMBEDDING_ONNX_INT8_FILE",
+    "onnx/model_qint8_arm64.onnx" if platform.machine().lower() in ("arm64", "aarch64")
+    else "onnx/model_qint8_avx2.onnx"
+)
+# Minimum cosine similarity to the torch vectors for a backend to share the index
+PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.99"))
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+_SAMPLE_TEXTS = [
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "CS101 covers variables, loops, functions and basic data structures.",
+    "The derivative of x squared is 2x.",
+    "Midterm exams are held in week eight of the semester.",
+    "Newton's second law states that force equals mass times acceleration.",
+    "A binary search tree keeps keys in sorted order for logarithmic lookups.",
+    "The French Revolution began in 1789 with the storming of the Bastille.",
+    "Mitochondria are the site of cellular respiration.",
+]
+
+
+def _rss_mb():
+    """Return the current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is KB on Linux (peak, not current, but better than nothing)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+def _model_kwargs(backend, device):
+    """SentenceTransformer constructor arguments for a backend."""
+    if backend == "torch":
+        return {'device': device}
+    if backend == "onnx":
+        return {'device': device, 'backend': 'onnx'}
+    if backend == "onnx-int8":
+        return {'device': device, 'backend': 'onnx',
+                'model_kwargs': {'file_name': EMBEDDING_ONNX_INT8_FILE}}
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend} (expected one of {', '.join(BACKENDS)})")
+
+
+def load_embeddings(backend=EMBEDDING_BACKEND, model_name=EMBEDDING_MODEL_NAME, device=EMBEDDING_DEVICE):
+    """Build a new (unshared) embeddings object for a backend."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=model_name, model_kwargs=_model_kwargs(backend, device))
+
+
+class EmbeddingService:
+    """Process-wide holder for the embedding model"""
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, device=EMBEDDING_DEVICE, backend=EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.device = device
+        self.backend = backend
+        self.load_time = None
+        self.memory_mb = None
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the shared embeddings object, loading it on first use."""
+        if self._embeddings is None:
+            with self._lock:
+                # Another thread may have finished loading while we waited
+                if self._embeddings is None:
+                    self._load()
+        return self._embeddings
+
+    def _load(self):
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+
+        # Force CPU usage for thread safety; encode() is safe to call
+        # concurrently from request threads once the model is loaded.
+        self._embeddings = load_embeddings(self.backend, self.model_name, self.device)
+
+        self.load_time = time.perf_counter() - start
+        self.memory_mb = max(0.0, _rss_mb() - rss_before)
+        print(f"[Embeddings] Loaded {self.model_name} ({self.backend}) on {self.device} "
+              f"in {self.load_time:.2f}s (+{self.memory_mb:.0f} MB)")
+
+    def is_loaded(self):
+        return self._embeddings is not None
+
+    def stats(self):
+        return {
+            'model_name': self.model_name,
+            'backend': self.backend,
+            'device': self.device,
+            'loaded': self.is_loaded(),
+            'load_time_seconds': round(self.load_time, 3) if self.load_time is not None else None,
+            'memory_mb': round(self.memory_mb, 1) if self.memory_mb is not None else None
+        }
+
+
+_service = EmbeddingService()
+
+
+def get_embeddings():
+    """Return the process-wide embeddings object (LangChain Embeddings)."""
+    return _service.get()
+
+
+def warmup():
+    """Load the model eagerly, e.g. at server start before taking requests."""
+    _service.get()
+    return _service.stats()
+
+
+def set_threads(count):
+    """
+    Cap the CPU threads the torch encoder uses in this process, so server
+    workers sharing a machine do not oversubscribe its cores. The ONNX
+    backends size their thread pool when the session is created.
+    """
+    if _service.backend != "torch":
+        return
+    import torch
+
+    torch.set_num_threads(max(1, count))
+
+
+def get_stats():
+    return _service.stats()
+
+
+def _cosines(a, b):
+    import numpy as np
+
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def check_parity(backend, texts=None, reference="torch"):
+    """
+    Compare a backend's vectors with the reference backend's on sample texts.
+
+    compatible means the backend can search (and extend) an index built
+    with the reference vectors without reindexing.
+    """
+    texts = texts or _SAMPLE_TEXTS
+    cosines = _cosines(load_embeddings(backend).embed_documents(texts),
+                       load_embeddings(reference).embed_documents(texts))
+    return {
+        'backend': backend,
+        'reference': reference,
+        'texts': len(texts),
+        'min_cosine': round(float(cosines.min()), 5),
+        'mean_cosine': round(float(cosines.mean()), 5),
+        'compatible': bool(cosines.min() >= PARITY_MIN_COSINE)
+    }
+
+
+def benchmark(backend, texts=None, rounds=3):
+    """Chunks embedded per second by a backend (best of several rounds)."""
+    texts = texts or _SAMPLE_TEXTS * 32
+    embeddings = load_embeddings(backend)
+    embeddings.embed_documents(texts[:8])  # warm up
+
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        embeddings.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    start = time.perf_counter()
+    for text in texts[:32]:
+        embeddings.embed_query(text)
+    query_ms = (time.perf_counter() - start) / min(len(texts), 32) * 1000
+
+    return {
+        'backend': backend,
+        'texts': len(texts),
+        'texts_per_second': round(len(texts) / best, 1),
+        'query_latency_ms': round(query_ms, 2)
+    }
@@ -0,0 +1,295 @@
+"""
+FAISS index construction and search parameters.
+
+Index types:
+    flat  - exact search (IndexFlatL2), best below a few tens of thousands of chunks
+    ivf   - inverted file with trained k-means centroids; search visits nprobe lists
+    hnsw  - graph index; search explores efSearch candidates
+    auto  - flat below FAISS_IVF_MIN_CHUNKS chunks, ivf above; an IVF index
+            only goes back to flat once the corpus shrinks FAISS_IVF_HYSTERESIS
+            below that, so a corpus around the threshold is not rebuilt on
+            every write
+
+Deletes remove rows in place from flat and IVF indexes (remove_rows). HNSW
+cannot remove entries: deleted rows stay in the graph as tombstones that
+searches skip, and the graph is rebuilt once they exceed
+FAISS_HNSW_MAX_TOMBSTONES of it.
+
+Vector codes (FAISS_COMPRESSION), independent of the structure above:
+    none  - full float32 vectors (1536 bytes per MiniLM vector)
+    sq8   - int8 scalar quantization (384 bytes per vector)
+    pq    - product quantization with FAISS_PQ_M sub-quantizers (FAISS_PQ_M bytes)
+
+Compressed indexes keep the exact vectors in a file next to the index that
+is memory-mapped at search time; the top k * FAISS_RERANK_FACTOR candidates
+are re-ranked against it (0 disables re-ranking).
+
+Configured with FAISS_INDEX_TYPE, FAISS_IVF_MIN_CHUNKS, FAISS_NPROBE,
+FAISS_EF_SEARCH, FAISS_COMPRESSION, FAISS_PQ_M and FAISS_RERANK_FACTOR in .env.
+"""
+
+import math
+import os
+
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto").lower()
+IVF_MIN_CHUNKS = int(os.getenv("FAISS_IVF_MIN_CHUNKS", "50000"))
+# An IVF index switches back to flat below IVF_MIN_CHUNKS * (1 - IVF_HYSTERESIS)
+IVF_HYSTERESIS = float(os.getenv("FAISS_IVF_HYSTERESIS", "0.2"))
+# Retrain IVF centroids once the corpus has grown this much past the training set
+IVF_RETRAIN_GROWTH = float(os.getenv("FAISS_IVF_RETRAIN_GROWTH", "4"))
+# Share of an HNSW graph that may be deleted rows before it is rebuilt without them
+HNSW_MAX_TOMBSTONES = float(os.getenv("FAISS_HNSW_MAX_TOMBSTONES", "0.2"))
+HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+DEFAULT_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+COMPRESSION = os.getenv("FAISS_COMPRESSION", "none").lower()
+PQ_M = int(os.getenv("FAISS_PQ_M", "48"))
+RERANK_FACTOR = int(os.getenv("FAISS_RERANK_FACTOR", "4"))
+# PQ trains 256 centroids per sub-quantizer; faiss wants ~39 points per centroid
+PQ_MIN_TRAINING_POINTS = 256 * 39
+
+
+def choose_index_type(num_vectors, requested=None, current=None):
+    """Index type for a corpus size; current is the type of the index being kept up to date, if any."""
+    requested = (requested or INDEX_TYPE).lower()
+    if requested != "auto":
+        return requested
+    threshold = IVF_MIN_CHUNKS * (1 - IVF_HYSTERESIS) if current == "ivf" else IVF_MIN_CHUNKS
+    return "ivf" if num_vectors >= threshold else "flat"
+
+
+def ivf_nlist(num_vectors):
+    # Usual rule of thumb: ~4*sqrt(N) lists, with enough points per centroid to train
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def pq_subquantizers(dim, requested=None):
+    """Largest sub-quantizer count <= requested that divides the dimension."""
+    m = min(requested or PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_index(vectors, index_type=None, compression=None):
+    """
+    Build and fill a FAISS index of the requested (or auto-selected) type.
+
+    Returns:
+        tuple: (index, info dict for the manifest)
+    """
+    import faiss
+    import numpy as np
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    index_type = choose_index_type(num_vectors, index_type)
+    compression = (compression or COMPRESSION).lower()
+
+    if index_type == "ivf" and num_vectors < 39:
+        # Too few points to train any centroids
+        index_type = "flat"
+    if compression == "pq" and num_vectors < PQ_MIN_TRAINING_POINTS:
+        print(f"[FAISS] {num_vectors} vectors is too few to train PQ, using sq8")
+        compression = "sq8"
+
+    info = {"index_type": index_type, "compression": compression, "trained_on": num_vectors}
+
+    if compression == "none":
+        codes = "Flat"
+    elif compression == "sq8":
+        codes = "SQ8"
+    elif compression == "pq":
+        info["pq_m"] = pq_subquantizers(dim)
+        codes = f"PQ{info['pq_m']}"
+    else:
+        raise ValueError(f"Unknown FAISS compression: {compression}")
+
+    if index_type == "flat":
+        description = codes
+    elif index_type == "ivf":
+        info["nlist"] = ivf_nlist(num_vectors)
+        description = f"IVF{info['nlist']},{codes}"
+    elif index_type == "hnsw":
+        info["M"] = HNSW_M
+        description = f"HNSW{HNSW_M}" if compression == "none" else f"HNSW{HNSW_M},{codes}"
+    else:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(_training_sample(vectors, info.get("nlist", 1)))
+
+    index.add(vectors)
+    return index, info
+
+
+def is_compressed(index):
+    """True when the index stores quantized codes rather than float32 vectors."""
+    import faiss
+
+    inner = faiss.downcast_index(index)
+    ivf = _ivf(index)
+    if ivf is not None:
+        return not isinstance(faiss.downcast_index(ivf), faiss.IndexIVFFlat)
+    if isinstance(inner, faiss.IndexHNSW):
+        return not isinstance(faiss.downcast_index(inner.storage), faiss.IndexFlat)
+    return not isinstance(inner, faiss.IndexFlat)
+
+
+def bytes_per_vector(index):
+    """Approximate in-memory size of one stored vector (codes only)."""
+    import faiss
+
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    ivf = _ivf(index)
+    if ivf is not None:
+        return ivf.code_size
+    if hasattr(inner, "code_size"):
+        return inner.code_size
+    return index.d * 4
+
+
+def _training_sample(vectors, nlist):
+    import numpy as np
+
+    sample_size = min(len(vectors), max(nlist * 256, PQ_MIN_TRAINING_POINTS))
+    if sample_size == len(vectors):
+        return vectors
+    rng = np.random.default_rng(0)
+    return vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+
+def _ivf(index):
+    import faiss
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def index_kind(index):
+    import faiss
+    if _ivf(index) is not None:
+        return "ivf"
+    if isinstance(faiss.downcast_index(index), faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def ivf_lists(index):
+    """Number of inverted lists of an IVF index (None for other types)."""
+    ivf = _ivf(index)
+    return ivf.nlist if ivf is not None else None
+
+
+def reconstruct_rows(index, rows):
+    """
+    Stored vectors of some rows of a flat or HNSW index (IVF needs a direct
+    map for this; decoded approximations for compressed codes).
+    """
+    import numpy as np
+
+    return index.reconstruct_batch(np.asarray(rows, dtype=np.int64))
+
+
+def supports_remove(index):
+    """Whether remove_rows() works on this index (HNSW cannot remove entries)."""
+    return index_kind(index) != "hnsw"
+
+
+def remove_rows(index, rows):
+    """
+    Remove rows from a flat or IVF index in place, keeping its training.
+
+    The rows after a removed one move up, so rows stay numbered
+    0..ntotal-1 in their old order. Flat storage is compacted by faiss; IVF
+    lists keep each entry's id and only drop the removed entries, so the
+    ids left in them are renumbered here. Nothing is re-added.
+    """
+    import faiss
+    import numpy as np
+
+    rows = np.unique(np.asarray(rows, dtype=np.int64))
+    if not len(rows):
+        return 0
+    removed = index.remove_ids(faiss.IDSelectorBatch(rows))
+    ivf = _ivf(index)
+    if ivf is not None:
+        invlists = ivf.invlists
+        for list_no in range(ivf.nlist):
+            size = invlists.list_size(list_no)
+            if not size:
+                continue
+            pointer = invlists.get_ids(list_no)
+            ids = faiss.rev_swig_ptr(pointer, size)
+            # Each id moves up by the number of removed rows before it
+            ids -= np.searchsorted(rows, ids)
+            invlists.release_ids(list_no, pointer)
+    return removed
+
+
+def refill_index(index, vectors):
+    """Empty copy of a trained index (same centroids / params) filled with vectors."""
+    import faiss
+    import numpy as np
+
+    refilled = faiss.clone_index(index)
+    refilled.reset()
+    refilled.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    return refilled
+
+
+def all_vectors(index):
+    """
+    Reconstruct every stored vector (used to retrain or re-shape an index).
+
+    For compressed indexes these are the decoded approximations.
+    """
+    ivf = _ivf(index)
+    if ivf is None:
+        return index.reconstruct_n(0, index.ntotal)
+    import faiss
+    ivf.make_direct_map()
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    finally:
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def needs_retrain(index, info, num_vectors=None):
+    """True when the index type no longer fits the corpus size (num_vectors, default ntotal)."""
+    num_vectors = index.ntotal if num_vectors is None else num_vectors
+    built_type = info.get("index_type", index_kind(index))
+    if INDEX_TYPE == "auto" and choose_index_type(num_vectors, current=built_type) != built_type:
+        return True
+    built_compression = info.get("compression", "none")
+    wanted_compression = COMPRESSION
+    if wanted_compression == "pq" and num_vectors < PQ_MIN_TRAINING_POINTS and built_compression != "pq":
+        # Too few points to train PQ; an index already trained keeps it as it shrinks
+        wanted_compression = "sq8"
+    if built_compression != wanted_compression:
+        return True
+    if built_type == "ivf":
+        return num_vectors > info.get("trained_on", num_vectors) * IVF_RETRAIN_GROWTH
+    return False
+
+
+def search_parameters(index, selector=None, nprobe=None, ef_search=None):
+    """Per-call FAISS search parameters for this index type."""
+    import faiss
+
+    kind = index_kind(index)
+    kwargs = {}
+    if selector is not None:
+        kwargs["sel"] = selector
+    if kind == "ivf":
+        return faiss.SearchParametersIVF(nprobe=nprobe or DEFAULT_NPROBE, **kwargs)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or DEFAULT_EF_SEARCH, **kwargs)
+    return faiss.SearchParameters(**kwargs) if kwargs else None
@@ -2,15 +2,14 @@ import os
 import json
 import sqlite3
 from datetime import datetime, date
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
+import llm
 import srs_algorithm
+import retrieval
+import vector_store
 
 load_dotenv()
 DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
 DB_PATH = os.path.join(DATA_DIR, "metadata.db")
 
 
@@ -252,31 +251,19 @@ class FlashcardManager:
 
 def generate_flashcards():
     """Generate flashcards from document content using Groq AI"""
-    api_key = os.getenv("GITHUB_TOKEN")
-    if not api_key:
+    if not llm.is_configured("github"):
         return {"flashcards": [], "error": "GITHUB_TOKEN missing. Please add it to your .env file."}
     
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    
-    if not os.path.exists(FAISS_INDEX_PATH):
-        return {"flashcards": [], "error": "No documents found."}
-    
     try:
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 10})
-        docs = retriever.invoke("key concepts definitions important terms explanations")
+        if not vector_store.list_collections():
+            return {"flashcards": [], "error": "No documents found."}
+        docs = retrieval.search(retrieval.FLASHCARDS_QUERY,
+                                k=10)
         context_text = "\n\n".join([d.page_content for d in docs])
         
     except Exception as e:
         return {"flashcards": [], "error": f"Error: {str(e)}"}
     
-    # Initialize GitHub Models client (OpenAI-compatible)
-    from openai import OpenAI
-    client = OpenAI(
-        base_url="https://models.inference.ai.azure.com",
-        api_key=api_key
-    )
-    
     prompt = f"""
     Based on the following text, create 10 flashcards for studying.
     Return strictly a JSON array with this structure:
@@ -295,16 +282,10 @@ def generate_flashcards():
     """
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful study assistant. Create clear, concise flashcards."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3
-        )
-        
-        content = response.choices[0].message.content.strip()
+        content = llm.chat("github", [
+            {"role": "system", "content": "You are a helpful study assistant. Create clear, concise flashcards."},
+            {"role": "user", "content": prompt}
+        ], temperature=0.3).strip()
         if content.startswith("```json"): content = content[7:]
         if content.startswith("```"): content = content[3:]
         if content.endswith("```"): content = content[:-3]
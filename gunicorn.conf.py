@@ -0,0 +1,32 @@
+"""
+Production server settings: gunicorn -c gunicorn.conf.py wsgi:app
+
+Several worker processes serve requests, each with a pool of threads
+(requests mostly wait on the LLM APIs). The app is preloaded in the
+master, so the embedding model and the mmap'd index are shared by all
+workers (see wsgi.py).
+
+Configured with WEB_BIND, WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT,
+WEB_GRACEFUL_TIMEOUT, WEB_KEEPALIVE and WEB_ENCODER_THREADS.
+"""
+
+import os
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_WORKERS", "0")) or os.cpu_count() or 1
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+# A chat request waits on retrieval plus an LLM completion
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+preload_app = True
+
+# Encoder threads per worker; by default the cores are split between the workers
+encoder_threads = int(os.getenv("WEB_ENCODER_THREADS", "0")) or max(1, (os.cpu_count() or 1) // workers)
+
+
+def post_worker_init(worker):
+    import wsgi
+
+    wsgi.init_worker(encoder_threads)
@@ -0,0 +1,128 @@
+"""
+Coalesced index updates.
+
+Uploads, deletes and rebuilds are queued as jobs in the 'index' job group
+(see job_queue). The group is debounced: it is only picked up once no new
+index job has arrived for INDEX_DEBOUNCE_SECONDS (and at most
+INDEX_MAX_DELAY after the oldest one was queued). Everything queued by
+then is applied as one update:
+
+- if the batch contains a rebuild, one rebuild runs. It re-indexes
+  data/temp, which already reflects every upload and delete queued with
+  it, so it absorbs them all;
+- otherwise the deleted documents' chunks are dropped and the uploaded
+  files are indexed in a single pipeline run that publishes one index
+  generation. If none of the uploaded files yields a page, the batch
+  fails and is retried like any other failed job.
+
+Jobs carry the collection they apply to (default if absent); a batch is
+split by collection and each collection's share is applied to its own
+index as above.
+
+Only one index batch runs at a time. A running rebuild is cancelled as
+soon as a newer rebuild of the same collection is queued, since that one
+will redo its work. Near-duplicate compaction (see compaction) is queued in
+the same group, so it never races an update; it runs after the rest of its
+batch.
+"""
+
+import os
+
+import compaction
+import ingest
+import ingest_pipeline
+import job_queue
+import vector_store
+
+INDEX_DEBOUNCE_SECONDS = float(os.getenv("INDEX_DEBOUNCE_SECONDS", "2"))
+INDEX_MAX_DELAY = float(os.getenv("INDEX_MAX_DELAY", "30"))
+
+
+def _collection(payload):
+    return payload.get('collection', vector_store.DEFAULT_COLLECTION)
+
+
+def _rebuild(jobs, collection):
+    newest = max(job['id'] for job in jobs)
+    try:
+        result = ingest.rebuild_faiss_index(
+            cancel=lambda: job_queue.has_queued('rebuild_index', after_id=newest,
+                                                where=lambda payload: _collection(payload) == collection),
+            collection=collection)
+    except ingest_pipeline.Cancelled:
+        result = "Superseded by a newer rebuild"
+    if len(jobs) > 1:
+        result += f" ({len(jobs)} index jobs coalesced)"
+    return result
+
+
+def _merge(jobs, collection):
+    """Net effect of a batch of uploads and deletes: (paths to index, filenames to drop)."""
+    deleted = set()
+    paths = []
+    for job in jobs:
+        if job['kind'] == 'delete_document':
+            deleted.add(job['payload']['filename'])
+        elif job['kind'] == 'index_files':
+            paths.extend(job['payload']['paths'])
+
+    # The live generation decides; chunk rows may be left over from an attempt that never published
+    indexed = set(vector_store.read_manifest(collection).get('documents', []))
+    to_index = []
+    for path in dict.fromkeys(paths):
+        filename = os.path.basename(path)
+        if not os.path.exists(path):
+            # Uploaded and then deleted within the batch
+            continue
+        if filename not in deleted and filename in indexed:
+            # Already indexed (a retried job whose first attempt got that far)
+            continue
+        to_index.append(path)
+    return to_index, sorted(deleted)
+
+
+def _compact(jobs, collection):
+    stats = compaction.compact(jobs[-1]['payload'].get('min_cosine'), collection=collection)
+    return (f"Merged {stats['mergeable']} near-duplicate chunks "
+            f"({stats['vectors']} -> {stats['vectors_after']} vectors, {stats['bytes_saved']} bytes)")
+
+
+def _apply_updates(jobs, collection):
+    if any(job['kind'] == 'rebuild_index' for job in jobs):
+        result = _rebuild(jobs, collection)
+    else:
+        paths, deleted = _merge(jobs, collection)
+        # Files being indexed are not in the index, but may have rows from an attempt that never published
+        leftovers = [os.path.basename(path) for path in paths]
+        stats = ingest_pipeline.ingest_files(paths, remove_filenames=sorted(set(deleted) | set(leftovers)),
+                                             collection=collection)
+        if paths and not stats['pages']:
+            # Nothing readable came back; fail the batch so it is retried (deletes are idempotent)
+            raise RuntimeError(f"No pages could be read from {len(paths)} file(s)")
+        result = (f"Indexed {stats['chunks']} chunks from {len(paths)} file(s), "
+                  f"removed {stats['removed']} chunks of {len(deleted)} document(s)")
+        if stats['deduplicated']:
+            result += f", {stats['deduplicated']} duplicate chunks share existing vectors"
+        if len(jobs) > 1:
+            result += f" in one update ({len(jobs)} index jobs coalesced)"
+    return {job['id']: result for job in jobs}
+
+
+@job_queue.group_handler('index', kinds=('index_files', 'delete_document', 'rebuild_index', 'compact_index'),
+                         debounce=INDEX_DEBOUNCE_SECONDS, max_delay=INDEX_MAX_DELAY)
+def apply_index_jobs(jobs):
+    """Apply a batch of queued index jobs as one index update per collection."""
+    by_collection = {}
+    for job in jobs:
+        by_collection.setdefault(_collection(job['payload']), []).append(job)
+
+    results = {}
+    for collection, batch in by_collection.items():
+        compactions = [job for job in batch if job['kind'] == 'compact_index']
+        updates = [job for job in batch if job['kind'] != 'compact_index']
+        if updates:
+            results.update(_apply_updates(updates, collection))
+        if compactions:
+            result = _compact(compactions, collection)
+            results.update({job['id']: result for job in compactions})
+    return results
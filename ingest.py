@@ -1,18 +1,18 @@
+import hashlib
 import os
 import sqlite3
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+import chunk_store
+import ingest_pipeline
+import job_queue
+import vector_store
 
 DATA_DIR = "data"
 FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
 DB_PATH = os.path.join(DATA_DIR, "metadata.db")
 
-# Ensure data directory exists
-os.makedirs(DATA_DIR, exist_ok=True)
-
 def init_db():
+    # Created here rather than at import, so importing this module has no side effects
+    os.makedirs(DATA_DIR, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
@@ -25,6 +25,17 @@ def init_db():
         )
     ''')
     
+    # File content hash, so a renamed copy of an uploaded PDF is recognised
+    cursor.execute('PRAGMA table_info(uploads)')
+    columns = {row[1] for row in cursor.fetchall()}
+    if 'content_hash' not in columns:
+        cursor.execute('ALTER TABLE uploads ADD COLUMN content_hash TEXT')
+    if 'size_bytes' not in columns:
+        cursor.execute('ALTER TABLE uploads ADD COLUMN size_bytes INTEGER')
+    # Collection (course / workspace) the document is indexed in
+    if 'collection' not in columns:
+        cursor.execute(f"ALTER TABLE uploads ADD COLUMN collection TEXT NOT NULL DEFAULT '{vector_store.DEFAULT_COLLECTION}'")
+    
     # Flashcards table with SM-2 algorithm fields
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS flashcards (
@@ -52,6 +63,12 @@ def init_db():
         )
     ''')
     
+    # Chunk ids per source document, so one document can be removed from the index
+    chunk_store.init_chunk_tables(cursor)
+    
+    # Background indexing jobs (uploads, deletes, rebuilds)
+    job_queue.init_job_tables(cursor)
+    
     # Chat history table for persistent conversation memory
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS chat_history (
@@ -66,141 +83,219 @@ def init_db():
     conn.commit()
     conn.close()
 
-def ingest_docs(files):
+def file_hash(stream):
+    """sha256 of a binary file object's contents (read from the start, rewound after)."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(1 << 20), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def upload_hashes(cursor):
+    """{content hash: filename} of the stored uploads, hashing older uploads on first use."""
+    cursor.execute('SELECT filename, content_hash FROM uploads')
+    hashes = {}
+    for filename, content_hash in cursor.fetchall():
+        if content_hash is None:
+            path = os.path.join(DATA_DIR, 'temp', filename)
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                content_hash = file_hash(f)
+            cursor.execute('UPDATE uploads SET content_hash = ?, size_bytes = ? WHERE filename = ?',
+                           (content_hash, os.path.getsize(path), filename))
+        hashes.setdefault(content_hash, filename)
+    return hashes
+
+def ingest_docs(files, collection=vector_store.DEFAULT_COLLECTION):
     if not files:
         return "No files provided."
+    vector_store.check_collection_name(collection)
 
     init_db()
     
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    # Get existing filenames
+    # Get existing filenames and file contents
     cursor.execute('SELECT filename FROM uploads')
     existing_files = set(row[0] for row in cursor.fetchall())
+    existing_hashes = upload_hashes(cursor)
     
-    documents = []
+    new_paths = []
     new_files = []
     skipped_files = []
     
     for file in files:
         filename = os.path.basename(file.name)
+        with open(file.name, 'rb') as f:
+            content_hash = file_hash(f)
         
-        # Check for duplicates
-        if filename in existing_files:
+        # Check for duplicates (same name, or same bytes under another name)
+        if filename in existing_files or content_hash in existing_hashes:
             print(f"Skipping duplicate file: {filename}")
             skipped_files.append(filename)
             continue
         
         # Add to database
-        cursor.execute('INSERT INTO uploads (filename) VALUES (?)', (filename,))
+        cursor.execute('INSERT INTO uploads (filename, content_hash, size_bytes, collection) VALUES (?, ?, ?, ?)',
+                       (filename, content_hash, os.path.getsize(file.name), collection))
         existing_files.add(filename)  # Update set to catch duplicates in same batch
+        existing_hashes[content_hash] = filename
         new_files.append(filename)
-        
-        try:
-            loader = PyPDFLoader(file.name)
-            # PyPDFLoader automatically adds 'page' and 'source' to metadata
-            docs = loader.load()
-            documents.extend(docs)
-        except Exception as e:
-            print(f"Error loading {filename}: {e}")
-            continue
+        new_paths.append(file.name)
             
     conn.commit()
     conn.close()
-
-    if not documents:
-        return "No valid documents found."
-
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    splits = text_splitter.split_documents(documents)
-
-    # Force CPU usage for thread safety
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'}
-    )
     
+    # Stream pages -> chunks -> embeddings -> index ('page' and 'source' metadata included)
     try:
-        if os.path.exists(FAISS_INDEX_PATH) and os.path.exists(os.path.join(FAISS_INDEX_PATH, "index.faiss")):
-            vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-            vectorstore.add_documents(splits)
-        else:
-            vectorstore = FAISS.from_documents(splits, embeddings)
-        
-        vectorstore.save_local(FAISS_INDEX_PATH)
+        stats = ingest_pipeline.ingest_files(new_paths, collection=collection)
     except Exception as e:
-        print(f"Index creation failed: {e}")
-        # Fallback create new
-        vectorstore = FAISS.from_documents(splits, embeddings)
-        vectorstore.save_local(FAISS_INDEX_PATH)
+        # A failed run never publishes, so the live index is intact; building a
+        # fresh index from just these files would drop every other document
+        print(f"Index update failed: {e}")
+        conn = sqlite3.connect(DB_PATH)
+        conn.executemany('DELETE FROM uploads WHERE filename = ?', [(f,) for f in new_files])
+        conn.commit()
+        conn.close()
+        return f"Indexing failed, the existing index is unchanged: {e}"
+
+    if not stats['chunks']:
+        return "No valid documents found."
 
-    result_msg = f"Successfully processed {len(new_files)} new file(s). Total chunks: {len(splits)}"
+    result_msg = f"Successfully processed {len(new_files)} new file(s). Total chunks: {stats['chunks']}"
     if skipped_files:
         result_msg += f"\nSkipped {len(skipped_files)} duplicate(s): {', '.join(skipped_files)}"
     
     return result_msg
 
-def get_uploaded_documents():
-    """Get list of all uploaded documents"""
+def get_uploaded_documents(collection=None):
+    """Get list of all uploaded documents (of one collection, if given)"""
     init_db()
     
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    cursor.execute('SELECT DISTINCT filename FROM uploads ORDER BY upload_time DESC')
+    if collection is None:
+        cursor.execute('SELECT DISTINCT filename FROM uploads ORDER BY upload_time DESC')
+    else:
+        cursor.execute('SELECT DISTINCT filename FROM uploads WHERE collection = ? ORDER BY upload_time DESC',
+                       (collection,))
     rows = cursor.fetchall()
     
     conn.close()
     
     return [row[0] for row in rows]
 
-def rebuild_faiss_index():
-    """Rebuild FAISS index from all documents in data/temp directory"""
+def get_collections():
+    """{collection: number of uploaded documents}"""
+    init_db()
+    
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('SELECT collection, COUNT(*) FROM uploads GROUP BY collection')
+    collections = dict(cursor.fetchall())
+    conn.close()
+    
+    return collections
+
+def get_document_collection(filename):
+    """Collection an uploaded document belongs to"""
+    init_db()
+    
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('SELECT collection FROM uploads WHERE filename = ?', (filename,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    return row[0] if row else vector_store.DEFAULT_COLLECTION
+
+def delete_document_vectors(filename, collection=vector_store.DEFAULT_COLLECTION):
+    """Remove a single document's chunks from its collection's FAISS index"""
+    removed = vector_store.delete_document(filename, collection=collection)
+    return f"Removed {removed} chunks of {filename} from index"
+
+def rollback_index(generation=None, collection=vector_store.DEFAULT_COLLECTION):
+    """
+    Make an earlier index generation of a collection live again and bring
+    the uploads list back in line with it.
+
+    The rolled-back index holds that generation's documents, while the
+    uploads table still lists what was uploaded (and not what was deleted)
+    since. Uploaded documents the index lacks are queued for indexing again
+    (uploads whose file is gone are dropped, so they can be re-uploaded),
+    and indexed documents that are no longer uploaded are queued for
+    deletion.
+
+    Returns:
+        dict: the generation's manifest, with 'reindexing', 'removing' and 'job_ids'
+    """
+    manifest = vector_store.rollback(generation, collection)
+    indexed = set(manifest.get('documents', []))
+    uploaded = set(get_uploaded_documents(collection))
+
+    reindex = []
+    missing = []
+    for filename in sorted(uploaded - indexed):
+        path = os.path.join(DATA_DIR, 'temp', filename)
+        (reindex if os.path.exists(path) else missing).append(path)
+    removing = sorted(indexed - uploaded)
+
+    if missing:
+        conn = sqlite3.connect(DB_PATH)
+        conn.executemany('DELETE FROM uploads WHERE filename = ?', [(os.path.basename(p),) for p in missing])
+        conn.commit()
+        conn.close()
+
+    job_ids = []
+    if reindex:
+        job_ids.append(job_queue.enqueue('index_files', paths=reindex, collection=collection))
+    job_ids.extend(job_queue.enqueue('delete_document', filename=filename, collection=collection)
+                   for filename in removing)
+
+    return dict(manifest, reindexing=[os.path.basename(p) for p in reindex], removing=removing,
+                job_ids=job_ids)
+
+def rebuild_faiss_index(cancel=None, collection=vector_store.DEFAULT_COLLECTION):
+    """
+    Rebuild a collection's FAISS index from its documents in data/temp.
+    
+    This re-parses and re-embeds the collection's corpus; it is a repair
+    operation, regular deletes go through delete_document_vectors(). cancel
+    is passed to ingest_pipeline.ingest_files (a newer rebuild supersedes
+    this one). PDFs without an uploads row belong to the default collection.
+    """
     import glob
-    from langchain_community.document_loaders import PyPDFLoader
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
     
-    print("=== Rebuilding FAISS Index ===")
+    print(f"=== Rebuilding FAISS Index ({collection}) ===")
+    
+    init_db()
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('SELECT filename, collection FROM uploads')
+    owners = dict(cursor.fetchall())
+    conn.close()
     
-    # Get all PDF files from temp directory
-    pdf_files = glob.glob(os.path.join(DATA_DIR, 'temp', '*.pdf'))
+    # Get the collection's PDF files from temp directory
+    pdf_files = [path for path in glob.glob(os.path.join(DATA_DIR, 'temp', '*.pdf'))
+                 if owners.get(os.path.basename(path), vector_store.DEFAULT_COLLECTION) == collection]
     
     if not pdf_files:
         print("No PDF files found to rebuild index")
         # Remove FAISS index if it exists
-        if os.path.exists(FAISS_INDEX_PATH):
-            import shutil
-            shutil.rmtree(FAISS_INDEX_PATH)
+        vector_store.clear_vectorstore(collection)
         return "No documents to index"
     
-    documents = []
-    
-    for pdf_path in pdf_files:
-        try:
-            loader = PyPDFLoader(pdf_path)
-            docs = loader.load()
-            documents.extend(docs)
-            print(f"Loaded: {os.path.basename(pdf_path)} ({len(docs)} pages)")
-        except Exception as e:
-            print(f"Error loading {pdf_path}: {e}")
-            continue
+    # Create new FAISS index, streaming the corpus through in batches
+    stats = ingest_pipeline.ingest_files(pdf_files, replace=True, cancel=cancel, collection=collection)
     
-    if not documents:
+    if not stats['chunks']:
         return "No valid documents to index"
     
-    # Split documents
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    splits = text_splitter.split_documents(documents)
+    print(f"✓ Rebuilt FAISS index with {stats['chunks']} chunks from {len(pdf_files)} files")
     
-    # Create new FAISS index (force CPU for thread safety)
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'}
-    )
-    vectorstore = FAISS.from_documents(splits, embeddings)
-    vectorstore.save_local(FAISS_INDEX_PATH)
-    
-    print(f"✓ Rebuilt FAISS index with {len(splits)} chunks from {len(pdf_files)} files")
-    
-    return f"Index rebuilt: {len(splits)} chunks from {len(pdf_files)} files"
+    return f"Index rebuilt: {stats['chunks']} chunks from {len(pdf_files)} files"
+
@@ -0,0 +1,165 @@
+"""
+Streaming ingestion pipeline.
+
+Pages flow parse -> split -> embed -> append through bounded queues, each
+stage in its own thread: PDF parsing, encoding and index writes overlap in
+time, and because every queue is bounded only a few batches are ever in
+memory, however large the upload. Chunk rows go to SQLite batch by batch
+and the index is published once, when the last batch is in.
+
+Configured with INGEST_EMBED_BATCH (chunks per encoder call) and
+INGEST_QUEUE_SIZE (batches buffered between stages).
+"""
+
+import os
+import queue
+import threading
+
+import embedding_cache
+import pdf_loader
+import vector_store
+
+EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+_DONE = object()
+
+
+class Cancelled(Exception):
+    """Raised by ingest_files() when its cancel callback asks it to stop."""
+
+
+def _put(q, item, stop):
+    """Blocking put that gives up once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q, stop):
+    """Yield items from q until the upstream stage is done."""
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _start_stage(name, work, inbox, outbox, stop, errors):
+    """Run work(items from inbox) in a thread, feeding what it yields to outbox."""
+
+    def run():
+        try:
+            items = _drain(inbox, stop) if inbox is not None else None
+            for item in work(items):
+                if not _put(outbox, item, stop):
+                    return
+        except Exception as e:
+            errors.append((name, e))
+            stop.set()
+            return
+        _put(outbox, _DONE, stop)
+
+    thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _split_batches(pages, stats):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    batch = []
+    for page in pages:
+        stats['pages'] += 1
+        batch.extend(text_splitter.split_documents([page]))
+        while len(batch) >= EMBED_BATCH:
+            yield batch[:EMBED_BATCH]
+            batch = batch[EMBED_BATCH:]
+    if batch:
+        yield batch
+
+
+def _embed_batches(batches):
+    for splits in batches:
+        yield splits, embedding_cache.embed_documents([doc.page_content for doc in splits])
+
+
+def ingest_files(paths, replace=False, remove_filenames=(), cancel=None,
+                 collection=vector_store.DEFAULT_COLLECTION):
+    """
+    Parse, split, embed and index PDFs in one streaming pass.
+
+    Args:
+        paths (list): PDF file paths
+        replace (bool): Build a fresh index from these files instead of
+            appending to the current one
+        remove_filenames (list): Documents whose existing chunks are dropped
+            in the same index update
+        cancel (callable): Polled once per batch; when it returns True the
+            run stops, its chunk rows are removed and Cancelled is raised
+        collection (str): Collection whose index the chunks go into
+
+    Returns:
+        dict: {'pages': pages parsed, 'chunks': chunks indexed, 'removed': chunks dropped,
+              'deduplicated': chunks sharing an already indexed vector}
+    """
+    stats = {'pages': 0, 'chunks': 0, 'removed': 0, 'deduplicated': 0}
+    stop = threading.Event()
+    errors = []
+
+    pages = queue.Queue(maxsize=QUEUE_SIZE * pdf_loader.PAGES_PER_TASK)
+    splits = queue.Queue(maxsize=QUEUE_SIZE)
+    embedded = queue.Queue(maxsize=QUEUE_SIZE)
+
+    threads = [
+        _start_stage("parse", lambda _: pdf_loader.iter_pdf_pages(paths), None, pages, stop, errors),
+        _start_stage("split", lambda items: _split_batches(items, stats), pages, splits, stop, errors),
+        _start_stage("embed", _embed_batches, splits, embedded, stop, errors),
+    ]
+
+    appender = vector_store.IndexAppender(replace=replace, remove_filenames=remove_filenames,
+                                          collection=collection)
+    cancelled = False
+    try:
+        for batch, vectors in _drain(embedded, stop):
+            if cancel is not None and cancel():
+                cancelled = True
+                break
+            appender.append(batch, vectors)
+            stats['chunks'] += len(batch)
+    except Exception as e:
+        errors.append(("append", e))
+    finally:
+        if errors or cancelled:
+            stop.set()
+        for thread in threads:
+            thread.join()
+
+    if cancelled:
+        appender.abort()
+        raise Cancelled(f"Ingestion of {len(paths)} file(s) cancelled")
+    if errors:
+        appender.abort()
+        stage, error = errors[0]
+        raise RuntimeError(f"Ingestion failed in {stage} stage: {error}") from error
+
+    try:
+        appender.commit()
+    except Exception:
+        appender.abort()
+        raise
+    stats['removed'] = appender.removed
+    stats['deduplicated'] = appender.deduplicated
+    print(f"[Ingest] Indexed {stats['chunks']} chunks from {stats['pages']} pages of {len(paths)} file(s)"
+          f" ({stats['deduplicated']} duplicates share an existing vector)")
+    return stats
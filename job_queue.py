@@ -0,0 +1,387 @@
+"""
+Durable background job queue in data/metadata.db.
+
+Uploads, deletes and index rebuilds are recorded as rows in the jobs table
+and run by a fixed pool of worker threads, so only JOB_WORKERS indexing
+jobs ever run at once and queued work survives a restart. A job moves
+queued -> running -> done, or back to queued with a growing delay when it
+raises, until it has failed JOB_MAX_ATTEMPTS times (failed).
+
+Job kinds are registered with @job_queue.handler(kind); the handler gets
+the job payload as keyword arguments and its return value is stored as the
+job result (a dict or list as JSON, which get_job() decodes again).
+
+Kinds can also share a group (@job_queue.group_handler). Group jobs are
+debounced: a new job pushes the whole queued group back by the group's
+debounce window (but never more than max_delay after a job was queued).
+When the group comes due, every queued job in it is claimed at once and
+handed to the group handler as a list, and only one batch per group runs
+at a time.
+
+When the server runs several worker processes, only one of them runs
+jobs (start_workers_in_one_process); the others just enqueue.
+
+Configured with JOB_WORKERS, JOB_MAX_ATTEMPTS and JOB_RETRY_DELAY.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process server only
+    fcntl = None
+
+DATA_DIR = "data"
+DB_PATH = os.path.join(DATA_DIR, "metadata.db")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Seconds before the first retry; doubles with every further attempt
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+# Workers also poll, for retries coming due and jobs queued by other processes
+POLL_INTERVAL = 2.0
+# Held by the one server process that runs jobs (see start_workers_in_one_process)
+RUNNER_LOCK_PATH = os.path.join(DATA_DIR, "job_runner.lock")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_handlers = {}
+_kind_groups = {}
+_groups = {}
+_wakeup = threading.Condition()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def init_job_tables(cursor):
+    """Create the jobs table (called from ingest.init_db)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER DEFAULT 0,
+            max_attempts INTEGER DEFAULT 3,
+            result TEXT,
+            error TEXT,
+            run_after REAL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
+    # Columns added for coalesced (grouped) jobs
+    cursor.execute('PRAGMA table_info(jobs)')
+    columns = {row[1] for row in cursor.fetchall()}
+    if 'job_group' not in columns:
+        cursor.execute('ALTER TABLE jobs ADD COLUMN job_group TEXT')
+    if 'queued_at' not in columns:
+        cursor.execute('ALTER TABLE jobs ADD COLUMN queued_at REAL DEFAULT 0')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_group ON jobs (job_group, status)')
+
+
+_schema_ready = False
+
+
+def _connect():
+    global _schema_ready
+    os.makedirs(DATA_DIR, exist_ok=True)
+    # Workers and request threads write concurrently; wait for the lock instead of failing
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    if not _schema_ready:
+        init_job_tables(conn.cursor())
+        conn.commit()
+        _schema_ready = True
+    return conn
+
+
+def handler(kind):
+    """Register the function that runs jobs of this kind."""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def group_handler(group, kinds, debounce=0.0, max_delay=0.0):
+    """
+    Register the function that runs batches of jobs of these kinds.
+
+    It is called with the claimed jobs (dicts, oldest first) and returns
+    {job id: result}.
+    """
+    def register(fn):
+        _groups[group] = {'fn': fn, 'debounce': debounce, 'max_delay': max_delay}
+        for kind in kinds:
+            _kind_groups[kind] = group
+        return fn
+    return register
+
+
+def enqueue(kind, max_attempts=None, **payload):
+    """Queue a job and return its id."""
+    if kind not in _handlers and kind not in _kind_groups:
+        raise ValueError(f"No handler registered for job kind: {kind}")
+
+    now = time.time()
+    group = _kind_groups.get(kind)
+    run_after = now + _groups[group]['debounce'] if group else 0
+
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO jobs (kind, payload, max_attempts, job_group, run_after, queued_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (kind, json.dumps(payload), max_attempts or JOB_MAX_ATTEMPTS, group, run_after, now))
+    job_id = cursor.lastrowid
+    if group:
+        # Slide the debounce window of the jobs already waiting in this group
+        cursor.execute('''
+            UPDATE jobs SET run_after = ?
+            WHERE status = ? AND job_group = ? AND run_after < ? AND queued_at >= ?
+        ''', (run_after, QUEUED, group, run_after, now - _groups[group]['max_delay']))
+    conn.commit()
+    conn.close()
+
+    with _wakeup:
+        _wakeup.notify()
+    return job_id
+
+
+_JOB_COLUMNS = ('id, kind, payload, status, attempts, max_attempts, result, error, '
+                'created_at, started_at, finished_at')
+
+
+def _row_to_job(row):
+    (job_id, kind, payload, status, attempts, max_attempts, result, error,
+     created_at, started_at, finished_at) = row
+    return {
+        'id': job_id,
+        'kind': kind,
+        'payload': json.loads(payload),
+        'status': status,
+        'attempts': attempts,
+        'max_attempts': max_attempts,
+        'result': _decode_result(result),
+        'error': error,
+        'created_at': created_at,
+        'started_at': started_at,
+        'finished_at': finished_at
+    }
+
+
+def _encode_result(result):
+    if result is None or isinstance(result, str):
+        return result
+    if isinstance(result, (dict, list)):
+        return json.dumps(result)
+    return str(result)
+
+
+def _decode_result(result):
+    if result and result[0] in '{[':
+        try:
+            return json.loads(result)
+        except ValueError:
+            pass
+    return result
+
+
+def get_job(job_id):
+    """Job as a dict, or None if there is no such job."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return _row_to_job(row) if row else None
+
+
+def has_queued(kind, after_id=0, where=None):
+    """True if a job of this kind newer than after_id (whose payload satisfies where, if given) is waiting."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT payload FROM jobs WHERE kind = ? AND status = ? AND id > ?',
+                   (kind, QUEUED, after_id))
+    found = any(where is None or where(json.loads(payload)) for payload, in cursor.fetchall())
+    conn.close()
+    return found
+
+
+def _claim():
+    """
+    Atomically mark the next runnable job (or group batch) as running.
+
+    Returns (group or None, list of jobs), or None when nothing is due.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'''
+            SELECT {_JOB_COLUMNS}, job_group FROM jobs
+            WHERE status = ? AND run_after <= ?
+              AND (job_group IS NULL OR job_group NOT IN (
+                  SELECT job_group FROM jobs WHERE status = ? AND job_group IS NOT NULL))
+            ORDER BY id LIMIT 1
+        ''', (QUEUED, time.time(), RUNNING))
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+
+        group = row[-1]
+        if group:
+            # Everything waiting in the group goes into this batch
+            cursor.execute(f'SELECT {_JOB_COLUMNS} FROM jobs WHERE status = ? AND job_group = ? ORDER BY id',
+                           (QUEUED, group))
+            rows = cursor.fetchall()
+        else:
+            rows = [row[:-1]]
+
+        cursor.executemany('''
+            UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [(RUNNING, r[0]) for r in rows])
+        conn.commit()
+    finally:
+        conn.close()
+
+    jobs = [_row_to_job(r) for r in rows]
+    for job in jobs:
+        job['status'] = RUNNING
+        job['attempts'] += 1
+    return group, jobs
+
+
+def _finish(job_id, status, result=None, error=None, run_after=0):
+    conn = _connect()
+    cursor = conn.cursor()
+    finished = 'CURRENT_TIMESTAMP' if status in (DONE, FAILED) else 'NULL'
+    cursor.execute(f'''
+        UPDATE jobs SET status = ?, result = ?, error = ?, run_after = ?, finished_at = {finished}
+        WHERE id = ?
+    ''', (status, result, error, run_after, job_id))
+    conn.commit()
+    conn.close()
+
+
+def _fail(job, error):
+    if job['attempts'] < job['max_attempts']:
+        delay = JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+        _finish(job['id'], QUEUED, error=str(error), run_after=time.time() + delay)
+        print(f"[Jobs] Job {job['id']} failed ({error}), retrying in {delay:.0f}s")
+    else:
+        _finish(job['id'], FAILED, error=str(error))
+        print(f"[Jobs] Job {job['id']} failed after {job['attempts']} attempts: {error}")
+
+
+def _run(group, jobs):
+    ids = ", ".join(str(job['id']) for job in jobs)
+    try:
+        if group:
+            print(f"[Jobs] Running {group} batch of {len(jobs)} job(s): {ids}")
+            results = _groups[group]['fn'](jobs)
+        else:
+            job = jobs[0]
+            fn = _handlers.get(job['kind'])
+            if fn is None:
+                raise ValueError(f"No handler registered for job kind: {job['kind']}")
+            print(f"[Jobs] Running {job['kind']} job {job['id']} (attempt {job['attempts']})")
+            results = {job['id']: fn(**job['payload'])}
+    except Exception as e:
+        traceback.print_exc()
+        for job in jobs:
+            _fail(job, e)
+        return
+
+    for job in jobs:
+        result = results.get(job['id'])
+        _finish(job['id'], DONE, result=_encode_result(result))
+    print(f"[Jobs] Job(s) {ids} done: {results.get(jobs[-1]['id'])}")
+
+
+def _worker_loop():
+    while True:
+        try:
+            claimed = _claim()
+        except sqlite3.Error as e:
+            print(f"[Jobs] Could not claim a job: {e}")
+            claimed = None
+        if claimed is None:
+            with _wakeup:
+                _wakeup.wait(POLL_INTERVAL)
+            continue
+        _run(*claimed)
+
+
+def recover_interrupted_jobs():
+    """
+    Re-queue jobs left running by a process that stopped mid-job.
+
+    Only call this from the process that owns the workers, before starting them.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('UPDATE jobs SET status = ?, run_after = 0 WHERE status = ?', (QUEUED, RUNNING))
+    recovered = cursor.rowcount
+    conn.commit()
+    conn.close()
+    if recovered:
+        print(f"[Jobs] Re-queued {recovered} interrupted job(s)")
+    return recovered
+
+
+def start_workers(count=None):
+    """Start the worker pool once per process (later calls are no-ops)."""
+    with _workers_lock:
+        if _workers:
+            return len(_workers)
+        recover_interrupted_jobs()
+        for i in range(count or JOB_WORKERS):
+            thread = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+        print(f"[Jobs] Started {len(_workers)} worker(s)")
+        return len(_workers)
+
+
+_runner_lock_file = None
+
+
+def start_workers_in_one_process(count=None):
+    """
+    Start the worker pool in exactly one of several server processes.
+
+    Every process calls this. A background thread waits for an exclusive
+    lock on RUNNER_LOCK_PATH and the process that gets it starts the pool
+    (recovering what was left running, which is safe because no other
+    process runs jobs). The OS releases the lock when that process exits,
+    and the next waiting process takes over.
+    """
+    if fcntl is None:
+        return start_workers(count)
+
+    def wait_for_lock():
+        global _runner_lock_file
+        os.makedirs(DATA_DIR, exist_ok=True)
+        lock_file = open(RUNNER_LOCK_PATH, "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Kept open for the life of the process; closing it releases the lock
+        _runner_lock_file = lock_file
+        print(f"[Jobs] Process {os.getpid()} runs the background jobs")
+        start_workers(count)
+
+    threading.Thread(target=wait_for_lock, name="job-runner-lock", daemon=True).start()
@@ -0,0 +1,214 @@
+"""
+Shared LLM providers.
+
+Every module that calls a chat model goes through chat() instead of
+building a client per request. Each provider holds one long-lived client
+per process, and that client keeps a pool of keep-alive HTTP connections,
+so a chat, quiz or summary request reuses an open TLS connection instead
+of paying for a fresh handshake.
+
+    github - GitHub Models (OpenAI-compatible API), GITHUB_TOKEN
+    groq   - Groq, GROQ_API_KEY
+    local  - offline stand-in that answers without any network call, for
+             tests and development (use_local(), or LLM_PROVIDER=local)
+
+Clients are created on first use. That happens after gunicorn forks its
+workers (see wsgi.py), and a forked child drops any client it inherited,
+so no connection is ever shared between processes.
+
+Configured with LLM_PROVIDER, GITHUB_MODEL, GROQ_MODEL, LLM_TIMEOUT,
+LLM_CONNECT_TIMEOUT, LLM_MAX_CONNECTIONS, LLM_KEEPALIVE_CONNECTIONS,
+LLM_KEEPALIVE_EXPIRY and LLM_MAX_RETRIES.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Route every call to this provider instead (e.g. "local" in tests)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "").lower() or None
+GITHUB_MODELS_URL = "https://models.inference.ai.azure.com"
+GITHUB_MODEL = os.getenv("GITHUB_MODEL", "gpt-4o-mini")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+# Seconds a completion may take, and to open a connection
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# Connections per provider and process, and how many idle ones stay open (and for how long)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+# Retries of connection errors, 429s and 5xx (with backoff, done by the SDK)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+
+def _http_client():
+    """httpx client with the configured keep-alive pool and timeouts."""
+    import httpx
+
+    return httpx.Client(
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                            max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+                            keepalive_expiry=LLM_KEEPALIVE_EXPIRY)
+    )
+
+
+class Provider(ABC):
+    """One chat model API; the SDK client is built once and shared by all threads"""
+
+    name = None
+    key_variable = None
+
+    def __init__(self, model):
+        self.model = model
+        self._client = None
+        self._lock = threading.Lock()
+
+    def api_key(self):
+        return os.getenv(self.key_variable)
+
+    def is_configured(self):
+        return bool(self.api_key())
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @abstractmethod
+    def _create_client(self):
+        """Build the SDK client (called once, on first use)."""
+
+    def chat(self, messages, temperature=None, max_tokens=None, model=None):
+        """Return the reply text for a list of chat messages."""
+        kwargs = {}
+        if temperature is not None:
+            kwargs['temperature'] = temperature
+        if max_tokens is not None:
+            kwargs['max_tokens'] = max_tokens
+        response = self.client().chat.completions.create(model=model or self.model, messages=messages, **kwargs)
+        return response.choices[0].message.content
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+class GitHubModelsProvider(Provider):
+    name = "github"
+    key_variable = "GITHUB_TOKEN"
+
+    def _create_client(self):
+        from openai import OpenAI
+
+        return OpenAI(base_url=GITHUB_MODELS_URL, api_key=self.api_key(),
+                      max_retries=LLM_MAX_RETRIES, http_client=_http_client())
+
+
+class GroqProvider(Provider):
+    name = "groq"
+    key_variable = "GROQ_API_KEY"
+
+    def _create_client(self):
+        from groq import Groq
+
+        return Groq(api_key=self.api_key(), max_retries=LLM_MAX_RETRIES, http_client=_http_client())
+
+
+class LocalProvider(Provider):
+    """
+    Offline stand-in: replies come from responder(messages), by default an
+    echo of the last message, and every call is recorded in calls.
+    """
+
+    name = "local"
+
+    def __init__(self, responder=None):
+        super().__init__("local")
+        self.responder = responder or (lambda messages: f"[local] {messages[-1]['content'][:200]}")
+        self.calls = []
+
+    def is_configured(self):
+        return True
+
+    def _create_client(self):
+        # Never called: chat() answers without a client
+        return None
+
+    def chat(self, messages, temperature=None, max_tokens=None, model=None):
+        self.calls.append({'messages': messages, 'temperature': temperature, 'max_tokens': max_tokens})
+        return self.responder(messages)
+
+    def close(self):
+        pass
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+_override = None
+
+
+def _create_provider(name):
+    if name == "github":
+        return GitHubModelsProvider(GITHUB_MODEL)
+    if name == "groq":
+        return GroqProvider(GROQ_MODEL)
+    if name == "local":
+        return LocalProvider()
+    raise ValueError(f"Unknown LLM provider: {name} (expected github, groq or local)")
+
+
+def get_provider(name):
+    """The process-wide provider for name (or the override, see use_local())."""
+    if _override is not None:
+        return _override
+    name = LLM_PROVIDER or name
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = _create_provider(name)
+        return _providers[name]
+
+
+def is_configured(name):
+    """True if calls to this provider can be made (its API key is set)."""
+    return get_provider(name).is_configured()
+
+
+def chat(name, messages, temperature=None, max_tokens=None, model=None):
+    """Send chat messages to a provider ('github' or 'groq') and return the reply text."""
+    return get_provider(name).chat(messages, temperature=temperature, max_tokens=max_tokens, model=model)
+
+
+def use_local(responder=None):
+    """Route every call in this process to a new LocalProvider (for tests); returns it."""
+    global _override
+    _override = LocalProvider(responder)
+    return _override
+
+
+def reset():
+    """Close the pooled clients and drop any override."""
+    global _override
+    _override = None
+    with _providers_lock:
+        providers = list(_providers.values())
+        _providers.clear()
+    for provider in providers:
+        provider.close()
+
+
+def _forget_inherited_clients():
+    # A forked child must not use the parent's connections; it builds its own
+    _providers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_clients)
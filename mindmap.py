@@ -1,33 +1,23 @@
-import os
 import json
-from groq import Groq
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
+import chunk_store
+import llm
+import retrieval
+import vector_store
 
 load_dotenv()
-DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
 
 def generate_mindmap_code():
     """Generate Mermaid.js syntax for 2D mind map using Groq"""
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key: return "graph TD; A[Error] --> B[GROQ_API_KEY Missing];"
-    
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    if not os.path.exists(FAISS_INDEX_PATH): return "graph TD; A[Empty] --> B[Upload Docs];"
+    if not llm.is_configured("groq"): return "graph TD; A[Error] --> B[GROQ_API_KEY Missing];"
     
     try:
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 8}) 
-        docs = retriever.invoke("overview structure hierarchy relationships")
+        if not vector_store.list_collections(): return "graph TD; A[Empty] --> B[Upload Docs];"
+        docs = retrieval.search(retrieval.MINDMAP_QUERY, k=8)
         context = "\n".join([d.page_content for d in docs])
     except:
         return "graph TD; A[Error] --> B[Retrieval Failed];"
 
-    # Use Groq for 2D mind map
-    client = Groq(api_key=api_key)
-    
     prompt = f"""
 Create a mind map in Mermaid.js format from this text.
 
@@ -52,12 +42,9 @@ Text: {context[:3000]}
 Return ONLY the Mermaid code:"""
     
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2  # Lower temperature for more consistent output
-        )
-        code = response.choices[0].message.content.strip()
+        # Groq for the 2D mind map; lower temperature for more consistent output
+        code = llm.chat("groq", [{"role": "user", "content": prompt}],
+                        temperature=0.2).strip()
         
         # Clean markdown code blocks
         if code.startswith("```mermaid"): code = code[10:]
@@ -78,16 +65,12 @@ Return ONLY the Mermaid code:"""
 
 def extract_topics_from_docs(selected_docs=None):
     """Extract main topics from documents for user selection"""
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
+    if not llm.is_configured("groq"):
         return {"error": "GROQ_API_KEY missing", "topics": []}
     
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    if not os.path.exists(FAISS_INDEX_PATH):
-        return {"error": "No documents uploaded", "topics": []}
-    
     try:
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+        if not vector_store.list_collections():
+            return {"error": "No documents uploaded", "topics": []}
         
         print(f"\n=== TOPIC EXTRACTION DEBUG ===")
         print(f"Selected documents from frontend: {selected_docs}")
@@ -98,39 +81,22 @@ def extract_topics_from_docs(selected_docs=None):
             normalized_selected = [d.lower().strip() for d in selected_docs]
             print(f"Normalized selected: {normalized_selected}")
             
-            # Get ALL documents from the vectorstore by using a very large k
-            # or by accessing the docstore directly
-            all_docs_dict = vectorstore.docstore._dict
-            print(f"Total chunks in vectorstore: {len(all_docs_dict)}")
+            # Fetch the selected documents' chunks straight from the chunk store
+            # (only as many as end up in the prompt)
+            filtered_docs = chunk_store.get_documents_for_sources(normalized_selected, limit=30, loose=True)
             
-            # Filter documents by source filename
-            filtered_docs = []
-            for doc_id, doc in all_docs_dict.items():
-                doc_source = doc.metadata.get('source', '')
-                doc_filename = os.path.basename(doc_source).lower().strip()
-                
-                # Check if this doc matches any selected document
-                for sel in normalized_selected:
-                    if doc_filename == sel or sel in doc_filename or doc_filename in sel:
-                        filtered_docs.append(doc)
-                        break
-            
-            print(f"Found {len(filtered_docs)} chunks matching selected documents")
+            print(f"Loaded {len(filtered_docs)} chunks from selected documents")
             
             if len(filtered_docs) == 0:
                 # List all unique filenames for debugging
-                all_filenames = set()
-                for doc in all_docs_dict.values():
-                    fn = os.path.basename(doc.metadata.get('source', '')).lower()
-                    all_filenames.add(fn)
+                all_filenames = set(fn.lower() for fn in chunk_store.get_indexed_filenames())
                 print(f"Available filenames in vectorstore: {all_filenames}")
                 return {"error": f"No content found for selected documents. Available: {list(all_filenames)}", "topics": []}
             
             docs = filtered_docs
         else:
             # No specific selection - use semantic search
-            retriever = vectorstore.as_retriever(search_kwargs={"k": 15})
-            docs = retriever.invoke("main topics concepts themes subjects overview")
+            docs = retrieval.search(retrieval.TOPICS_QUERY, k=15)
         
         print(f"Using {len(docs)} document chunks for topic extraction")
         
@@ -146,8 +112,6 @@ def extract_topics_from_docs(selected_docs=None):
         traceback.print_exc()
         return {"error": str(e), "topics": []}
     
-    client = Groq(api_key=api_key)
-    
     prompt = f"""Extract 5-8 main topics/themes from this text.
 
 Return ONLY a JSON array of topic objects:
@@ -167,13 +131,8 @@ Text: {context[:4000]}
 JSON:"""
     
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-        
-        result = response.choices[0].message.content.strip()
+        result = llm.chat("groq", [{"role": "user", "content": prompt}],
+                          temperature=0.3).strip()
         
         # Clean markdown
         if result.startswith("```json"): result = result[7:]
@@ -191,29 +150,13 @@ JSON:"""
 
 def generate_mindmap_for_topic(topic_name, topic_description="", selected_docs=None):
     """Generate mind map for a specific topic"""
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key: return "graph TD; A[Error] --> B[GROQ_API_KEY Missing];"
-    
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    if not os.path.exists(FAISS_INDEX_PATH): return "graph TD; A[Empty] --> B[Upload Docs];"
+    if not llm.is_configured("groq"): return "graph TD; A[Error] --> B[GROQ_API_KEY Missing];"
     
     try:
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 10})
-        # Search specifically for the chosen topic
-        docs = retriever.invoke(f"{topic_name} {topic_description}")
-        
-        # Filter by selected documents if provided
-        if selected_docs and len(selected_docs) > 0:
-            filtered_docs = []
-            for doc in docs:
-                doc_source = doc.metadata.get('source', '')
-                # Extract just the filename from the full path
-                doc_filename = os.path.basename(doc_source)
-                # Check if this document is in the selected list
-                if doc_filename in selected_docs:
-                    filtered_docs.append(doc)
-            docs = filtered_docs if filtered_docs else docs  # Fallback to all if no matches
+        if not vector_store.list_collections(): return "graph TD; A[Empty] --> B[Upload Docs];"
+        # Search specifically for the chosen topic, within the selected documents
+        docs = retrieval.search(f"{topic_name} {topic_description}",
+                                k=10, sources=selected_docs)
         
         if not docs or len(docs) == 0:
             return "graph TD; A[No Content] --> B[No matching documents found];"
@@ -223,8 +166,6 @@ def generate_mindmap_for_topic(topic_name, topic_description="", selected_docs=N
         print(f"Error in mindmap generation: {e}")
         return "graph TD; A[Error] --> B[Retrieval Failed];"
 
-    client = Groq(api_key=api_key)
-    
     prompt = f"""Create a detailed mind map about "{topic_name}" using Mermaid.js.
 
 STRICT RULES:
@@ -247,12 +188,8 @@ Relevant Content: {context[:3500]}
 Return ONLY the Mermaid code:"""
     
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.25
-        )
-        code = response.choices[0].message.content.strip()
+        code = llm.chat("groq", [{"role": "user", "content": prompt}],
+                        temperature=0.25).strip()
         
         # Clean
         if code.startswith("```mermaid"): code = code[10:]
@@ -272,42 +209,22 @@ Return ONLY the Mermaid code:"""
 
 def generate_knowledge_graph(topic_name="General", topic_description="", selected_docs=None):
     """Generate 3D knowledge graph data using GitHub Models GPT-4o mini"""
-    api_key = os.getenv("GITHUB_TOKEN")
-    if not api_key:
+    if not llm.is_configured("github"):
         return {"error": "GITHUB_TOKEN missing", "nodes": [], "edges": []}
     
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    if not os.path.exists(FAISS_INDEX_PATH):
-        return {"nodes": [{"id": 1, "name": "No Documents", "group": 1}], "links": []}
-    
     try:
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        
-        # Use more documents if filtering
-        search_k = 20 if selected_docs else 10
-        retriever = vectorstore.as_retriever(search_kwargs={"k": search_k})
+        if not vector_store.list_collections():
+            return {"nodes": [{"id": 1, "name": "No Documents", "group": 1}], "links": []}
         
-        # Search for the specific topic
+        # Search for the specific topic, within the selected documents
         search_query = f"{topic_name} {topic_description} concepts relationships structure"
-        docs = retriever.invoke(search_query)
+        docs = retrieval.search(search_query, k=10, sources=selected_docs)
         
         print(f"\n=== 3D GRAPH DEBUG ===")
         print(f"Topic: {topic_name}")
         print(f"Selected documents: {selected_docs}")
         print(f"Retrieved {len(docs)} documents from FAISS")
         
-        # Filter by selected documents if provided
-        if selected_docs and len(selected_docs) > 0:
-            filtered_docs = []
-            for doc in docs:
-                doc_source = doc.metadata.get('source', '')
-                doc_filename = os.path.basename(doc_source)
-                if doc_filename in selected_docs:
-                    filtered_docs.append(doc)
-            
-            print(f"Filtered to {len(filtered_docs)} documents")
-            docs = filtered_docs if filtered_docs else docs
-        
         if not docs:
             return {"nodes": [{"id": 1, "name": "No Content", "group": 1}], "links": []}
             
@@ -317,14 +234,6 @@ def generate_knowledge_graph(topic_name="General", topic_description="", selecte
     except Exception as e:
         return {"error": str(e), "nodes": [], "links": []}
     
-    # Use GitHub Models for 3D graph
-    from openai import OpenAI
-    
-    client = OpenAI(
-        base_url="https://models.inference.ai.azure.com",
-        api_key=api_key
-    )
-    
     prompt = f"""Create a 3D knowledge graph about "{topic_name}" from this text.
 
 Return ONLY valid JSON in this exact format:
@@ -355,13 +264,9 @@ Text: {context[:4000]}
 Return ONLY the JSON:"""
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-        
-        result = response.choices[0].message.content.strip()
+        # GitHub Models for the 3D graph
+        result = llm.chat("github", [{"role": "user", "content": prompt}],
+                          temperature=0.3).strip()
         
         # Clean markdown code blocks
         if result.startswith("```json"): result = result[7:]
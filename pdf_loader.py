@@ -0,0 +1,106 @@
+"""
+Parallel PDF text extraction.
+
+Each PDF is cut into page ranges and the ranges are fanned out across a
+process pool, so a bulk upload uses every core instead of parsing one
+page at a time. Pages come back as LangChain Documents with the same
+'source' / 'page' metadata PyPDFLoader produces, in file and page order.
+
+Configured with PDF_WORKERS (default: CPU count) and PDF_PAGES_PER_TASK.
+"""
+
+import multiprocessing
+import os
+import pickle
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or os.cpu_count() or 1
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+# Failures of the pool or the machine rather than of one PDF; they fail the whole run
+_INFRASTRUCTURE_ERRORS = (BrokenProcessPool, CancelledError, pickle.PicklingError, MemoryError)
+
+
+def _page_count(path):
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _extract_pages(path, start, end, source=None):
+    """Worker: text of pages [start, end) as picklable (text, metadata) tuples."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    total_pages = len(reader.pages)
+    return [
+        (reader.pages[i].extract_text() or "", {'source': source or path, 'page': i, 'total_pages': total_pages})
+        for i in range(start, end)
+    ]
+
+
+def _plan_tasks(paths):
+    tasks = []
+    for path in paths:
+        try:
+            pages = _page_count(path)
+        except Exception as e:
+            print(f"Error loading {os.path.basename(path)}: {e}")
+            continue
+        for start in range(0, pages, PAGES_PER_TASK):
+            tasks.append((path, start, min(start + PAGES_PER_TASK, pages)))
+    return tasks
+
+
+def _to_documents(pages):
+    from langchain_core.documents import Document
+    return [Document(page_content=text, metadata=metadata) for text, metadata in pages]
+
+
+def iter_pdf_pages(paths, workers=None):
+    """
+    Yield page Documents for the given PDFs, in file and page order.
+
+    Page ranges are parsed in parallel; at most a few ranges per worker are
+    in flight at once, so memory stays bounded however large the batch is.
+    A PDF (or page range) that cannot be read is skipped; a broken pool
+    raises, so the run fails instead of finishing with pages missing.
+    """
+    tasks = _plan_tasks(paths)
+    workers = min(workers or PDF_WORKERS, len(tasks))
+
+    if workers <= 1:
+        for path, start, end in tasks:
+            try:
+                yield from _to_documents(_extract_pages(path, start, end))
+            except _INFRASTRUCTURE_ERRORS:
+                raise
+            except Exception as e:
+                print(f"Error loading {os.path.basename(path)} pages {start}-{end}: {e}")
+        return
+
+    # spawn rather than fork: the server process has model and request threads running
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        task_iter = iter(tasks)
+
+        def submit_next():
+            task = next(task_iter, None)
+            if task is not None:
+                # Workers get an absolute path; metadata keeps the path as given
+                path, start, end = task
+                pending.append((task, pool.submit(_extract_pages, os.path.abspath(path), start, end, path)))
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending:
+            (path, start, end), future = pending.popleft()
+            submit_next()
+            try:
+                yield from _to_documents(future.result())
+            except _INFRASTRUCTURE_ERRORS:
+                raise
+            except Exception as e:
+                print(f"Error loading {os.path.basename(path)} pages {start}-{end}: {e}")
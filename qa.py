@@ -1,15 +1,13 @@
 import os
 import sqlite3
-from openai import OpenAI
-from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+import llm
+import retrieval
+import vector_store
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
 DB_PATH = os.path.join(DATA_DIR, "metadata.db")
 
 
@@ -48,48 +46,28 @@ def clear_chat_history():
     conn.commit()
     conn.close()
 
-def get_qa_chain():
-    api_key = os.getenv("GITHUB_TOKEN")
-    if not api_key:
-        return None
-
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    
-    if not os.path.exists(FAISS_INDEX_PATH):
-        return None
-
+def resolve_collections():
+    """Collections a question is answered from (their shards are searched), or None if nothing is indexed"""
     try:
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+        collections = vector_store.list_collections()
     except:
         return None
-
-    # Return vectorstore retriever instead of chain
-    return vectorstore.as_retriever(search_kwargs={"k": 3})
+    return collections or None
 
 def ask_question(query, selected_docs=None):
-    retriever = get_qa_chain()
-    if not retriever:
+    collections = resolve_collections()
+    if not collections:
         return "Please upload documents first.", []
     
     try:
-        # Get GitHub token
-        api_key = os.getenv("GITHUB_TOKEN")
-        if not api_key:
+        if not llm.is_configured("github"):
             return "GITHUB_TOKEN missing. Please add it to your .env file.", []
         
-        # Initialize GitHub Models client (OpenAI-compatible)
-        client = OpenAI(
-            base_url="https://models.inference.ai.azure.com",
-            api_key=api_key
-        )
+        # Retrieve relevant documents (vector + keyword ranking, restricted to the selection before ranking)
+        docs = retrieval.search(query, k=3, sources=selected_docs, collections=collections)
         
-        # Retrieve relevant documents
-        docs = retriever.invoke(query)
-        
-        # Filter by selected documents if provided
-        if selected_docs and len(selected_docs) > 0:
-            docs = [doc for doc in docs 
-                   if os.path.basename(doc.metadata.get('source', '')) in selected_docs]
+        if not docs and selected_docs:
+            return "No indexed content found in the selected documents yet. If you just uploaded them, indexing may still be running.", []
         
         # Build context from documents
         context = "\n\n".join([doc.page_content for doc in docs])
@@ -109,16 +87,10 @@ Current question: {query}
 Please answer based on the provided context. If the answer isn't in the context, say so."""
         
         # Call GitHub Models GPT-4o mini
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful study assistant. Answer questions based on the provided document context."},
-                {"role": "user", "content": full_prompt}
-            ],
-            temperature=0.3
-        )
-        
-        answer = response.choices[0].message.content
+        answer = llm.chat("github", [
+            {"role": "system", "content": "You are a helpful study assistant. Answer questions based on the provided document context."},
+            {"role": "user", "content": full_prompt}
+        ], temperature=0.3)
         
         # Format citations
         formatted_sources = []
@@ -126,6 +98,8 @@ Please answer based on the provided context. If the answer isn't in the context,
             page = doc.metadata.get('page', 0) + 1  # 0-indexed
             source = os.path.basename(doc.metadata.get('source', 'Unknown'))
             formatted_sources.append(f"{source} (Page {page})")
+            for ref in doc.metadata.get('duplicate_sources', []):
+                formatted_sources.append(f"{ref['source']} (Page {(ref['page'] or 0) + 1})")
             
         unique_sources = list(set(formatted_sources))
         
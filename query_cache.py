@@ -0,0 +1,106 @@
+"""
+In-memory LRU cache of query embeddings.
+
+Every retrieval.search() call embeds its query through here, so a repeated
+question (or the same topic searched again by the mind map) reuses the
+vector instead of running the encoder. The study tools' fixed queries are
+precomputed at warmup and pinned: they are never evicted, so quiz, summary,
+flashcard and mind map retrieval never touch the encoder at all.
+
+Configured with QUERY_CACHE_SIZE (0 disables caching of ad-hoc queries).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_service import get_embeddings
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+
+
+class QueryCache:
+    """Query text -> vector, least recently used entries evicted first"""
+
+    def __init__(self, capacity=QUERY_CACHE_SIZE):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def embed_query(self, text, embed_fn):
+        """Return the vector for text, calling embed_fn only on a miss."""
+        with self._lock:
+            vector = self._pinned.get(text)
+            if vector is None:
+                vector = self._entries.get(text)
+                if vector is not None:
+                    self._entries.move_to_end(text)
+            if vector is not None:
+                self.hits += 1
+                return vector
+            self.misses += 1
+
+        # Encode outside the lock so a slow query does not hold up cached ones
+        vector = self._freeze(embed_fn(text))
+        if self.capacity > 0:
+            with self._lock:
+                self._entries[text] = vector
+                self._entries.move_to_end(text)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        return vector
+
+    def pin(self, texts, embed_fn):
+        """Precompute vectors for texts and keep them for the life of the process."""
+        missing = [t for t in dict.fromkeys(texts) if t not in self._pinned]
+        vectors = {t: self._freeze(embed_fn(t)) for t in missing}
+        with self._lock:
+            self._pinned.update(vectors)
+            for text in vectors:
+                self._entries.pop(text, None)
+        return len(vectors)
+
+    @staticmethod
+    def _freeze(vector):
+        # Shared between request threads; make sure no caller edits it in place
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.flags.writeable = False
+        return vector
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'capacity': self.capacity,
+                'entries': len(self._entries),
+                'pinned': len(self._pinned),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None
+            }
+
+
+_cache = QueryCache()
+
+
+def embed_query(text):
+    """Embed a search query through the shared model, reusing cached vectors."""
+    # The model is only looked up (and loaded, if need be) on a miss
+    return _cache.embed_query(text, lambda t: get_embeddings().embed_query(t))
+
+
+def precompute(texts):
+    """Pin vectors for fixed queries (see retrieval.TOOL_QUERIES)."""
+    pinned = _cache.pin(texts, get_embeddings().embed_query)
+    if pinned:
+        print(f"[QueryCache] Precomputed {pinned} fixed query vectors")
+    return pinned
+
+
+def get_stats():
+    return _cache.stats()
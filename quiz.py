@@ -1,32 +1,22 @@
 import os
 import json
-from groq import Groq
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
+import llm
+import retrieval
+import vector_store
 
 load_dotenv()
 
-DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
-
 def generate_quiz(selected_docs=None, num_questions=10, difficulty="medium"):
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
+    if not llm.is_configured("groq"):
         return {"questions": [], "error": "GROQ_API_KEY missing. Please add it to your .env file."}
 
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    
-    if not os.path.exists(FAISS_INDEX_PATH):
-        return {"questions": [], "error": "No knowledge base found."}
-
     try:
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+        if not vector_store.list_collections():
+            return {"questions": [], "error": "No knowledge base found."}
         
-        # Get more documents if filtering
-        search_k = 20 if selected_docs else 8
-        retriever = vectorstore.as_retriever(search_kwargs={"k": search_k}) 
-        docs = retriever.invoke("important concepts summary definitions main points")
+        docs = retrieval.search(retrieval.QUIZ_QUERY,
+                                k=8, sources=selected_docs)
         
         print(f"\n=== QUIZ GENERATION DEBUG ===")
         print(f"Selected documents: {selected_docs}")
@@ -34,18 +24,6 @@ def generate_quiz(selected_docs=None, num_questions=10, difficulty="medium"):
         print(f"Difficulty: {difficulty}")
         print(f"Retrieved {len(docs)} documents from FAISS")
         
-        # Filter by selected documents if provided
-        if selected_docs and len(selected_docs) > 0:
-            filtered_docs = []
-            for doc in docs:
-                doc_source = doc.metadata.get('source', '')
-                doc_filename = os.path.basename(doc_source)
-                if doc_filename in selected_docs:
-                    filtered_docs.append(doc)
-            
-            print(f"Filtered to {len(filtered_docs)} documents from selected files")
-            docs = filtered_docs if filtered_docs else docs
-        
         if not docs:
             return {"questions": [], "error": "No content found in selected documents."}
         
@@ -56,9 +34,6 @@ def generate_quiz(selected_docs=None, num_questions=10, difficulty="medium"):
     except Exception as e:
         return {"questions": [], "error": f"Error retrieving context: {str(e)}"}
 
-    # Initialize Groq client
-    client = Groq(api_key=api_key)
-
     # Build document context info
     doc_names = list(set([os.path.basename(d.metadata.get('source', 'Unknown')) for d in docs]))
     doc_context = f"Content from documents: {', '.join(doc_names)}" if doc_names else ""
@@ -98,13 +73,8 @@ def generate_quiz(selected_docs=None, num_questions=10, difficulty="medium"):
     """
 
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.4
-        )
-        
-        content = response.choices[0].message.content.strip()
+        content = llm.chat("groq", [{"role": "user", "content": prompt}],
+                           temperature=0.4).strip()
         if content.startswith("```json"): content = content[7:]
         if content.startswith("```"): content = content[3:]
         if content.endswith("```"): content = content[:-3]
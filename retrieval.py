@@ -0,0 +1,313 @@
+"""
+Similarity search with document pre-filtering.
+
+When the user selects documents, the search space is restricted to those
+documents' vectors *before* ranking (a FAISS IDSelector over their chunk
+ids), so a k=3 query returns the 3 best chunks from the selection instead
+of the global top 3 minus whatever did not match. IVF and HNSW indexes only
+visit part of the index per query, which may hold few of the selected
+rows, so a selection of at most SELECTION_EXACT_SHARE of a shard is scored
+row by row, and a larger one falls back to that when the search comes
+back short.
+
+Search is hybrid by default: the vector ranking is fused with a BM25
+ranking from the chunk store's FTS5 index by reciprocal rank fusion, so
+exact terms (course codes, formulas, acronyms) that MiniLM misses still
+reach the top k. Configured with HYBRID_SEARCH, HYBRID_CANDIDATES and
+RRF_K.
+
+Query vectors come from query_cache, so repeated queries skip the encoder;
+the study tools search with the fixed queries below, whose vectors are
+precomputed by warm_query_cache() at server start.
+
+Each collection (course or workspace, see vector_store) is its own index
+shard. A search goes to the shards holding the selected documents (or to
+every shard when nothing is selected), runs them concurrently on a pool of
+SEARCH_THREADS threads (FAISS releases the GIL while it searches) and
+merges the per-shard hits into one top k.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import chunk_store
+import faiss_index
+import query_cache
+import vector_store
+
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+# Each ranking contributes max(k * HYBRID_CANDIDATES, 20) candidates to the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))
+# Reciprocal rank fusion constant: score = sum of 1 / (RRF_K + rank)
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Shards searched at once
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", "4"))
+# Document selections up to this share of an IVF / HNSW shard skip the approximate search
+SELECTION_EXACT_SHARE = float(os.getenv("SELECTION_EXACT_SHARE", "0.1"))
+
+# Fixed retrieval queries of the study tools
+FLASHCARDS_QUERY = "key concepts definitions important terms explanations"
+MINDMAP_QUERY = "overview structure hierarchy relationships"
+TOPICS_QUERY = "main topics concepts themes subjects overview"
+QUIZ_QUERY = "important concepts summary definitions main points"
+SUMMARY_QUERY = "core concepts summary main ideas key points details conclusion"
+TOOL_QUERIES = (FLASHCARDS_QUERY, MINDMAP_QUERY, TOPICS_QUERY, QUIZ_QUERY, SUMMARY_QUERY)
+
+_positions_lock = threading.Lock()
+_positions = {}  # collection -> (vectorstore, {docstore id: FAISS row}, tombstone rows)
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def _shard_rows(vectorstore):
+    """
+    (docstore id -> FAISS row, rows of deleted chunks still in the index),
+    rebuilt whenever a new index generation is loaded.
+    """
+    collection = getattr(vectorstore, "collection", None)
+    with _positions_lock:
+        store, positions, dead = _positions.get(collection, (None, None, None))
+        if store is not vectorstore:
+            positions = {doc_id: pos for pos, doc_id in vectorstore.index_to_docstore_id.items()}
+            dead = vector_store.tombstones(vectorstore)
+            _positions[collection] = (vectorstore, positions, dead)
+        return positions, dead
+
+
+def _position_map(vectorstore):
+    """docstore id -> FAISS row of the live chunks."""
+    return _shard_rows(vectorstore)[0]
+
+
+def _search_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, SEARCH_THREADS), thread_name_prefix="search")
+        return _pool
+
+
+def _positions_for_sources(vectorstore, filenames):
+    positions = _position_map(vectorstore)
+    vector_ids = chunk_store.get_vector_ids_for_sources(filenames)
+    return [positions[vector_id] for vector_id in vector_ids if vector_id in positions]
+
+
+def _search_hits(vectorstore, query_vector, k, candidates, selector=None,
+                 nprobe=None, ef_search=None, rerank=True):
+    """(distance, FAISS row) for the top k, re-ranked with exact vectors when the index is compressed."""
+    exact_vectors = getattr(vectorstore, "exact_vectors", None)
+    rerank = rerank and exact_vectors is not None and faiss_index.RERANK_FACTOR > 0
+    fetch = min(k * faiss_index.RERANK_FACTOR if rerank else k, candidates)
+
+    params = faiss_index.search_parameters(vectorstore.index, selector, nprobe, ef_search)
+    distances, labels = vectorstore.index.search(query_vector, fetch, params=params)
+    hits = [(float(distance), int(label)) for distance, label in zip(distances[0], labels[0]) if label != -1]
+
+    if rerank and hits:
+        rows = [row for _, row in hits]
+        exact = ((exact_vectors[rows] - query_vector[0]) ** 2).sum(axis=1)
+        hits = sorted(zip(exact.tolist(), rows))
+    return hits[:k]
+
+
+def _search_rows(vectorstore, query_vector, k, candidates, selector=None,
+                 nprobe=None, ef_search=None, rerank=True):
+    """FAISS rows for the top k (see _search_hits)."""
+    return [row for _, row in _search_hits(vectorstore, query_vector, k, candidates, selector,
+                                           nprobe, ef_search, rerank)]
+
+
+def _selection_hits(vectorstore, query_vector, k, allowed, selector):
+    """(distance, FAISS row) of the top k of the allowed rows, scoring every one of them."""
+    import numpy as np
+
+    index = vectorstore.index
+    exact_vectors = getattr(vectorstore, "exact_vectors", None)
+    if exact_vectors is None and faiss_index.index_kind(index) == "ivf":
+        # Probing every list scores exactly the selected rows (the selector skips the rest)
+        return _search_hits(vectorstore, query_vector, k, len(allowed), selector,
+                            nprobe=faiss_index.ivf_lists(index))
+
+    rows = np.asarray(allowed, dtype=np.int64)
+    if exact_vectors is not None:
+        vectors = np.asarray(exact_vectors[rows], dtype=np.float32)
+    else:
+        vectors = faiss_index.reconstruct_rows(index, rows)
+    distances = ((vectors - query_vector[0]) ** 2).sum(axis=1)
+    top = np.argsort(distances, kind="stable")[:k]
+    return [(float(distances[i]), int(rows[i])) for i in top]
+
+
+def _shard_hits(vectorstore, query_vector, k, filenames=None, nprobe=None, ef_search=None):
+    """(distance, docstore id) of one shard's top k, restricted to filenames if given."""
+    import faiss
+    import numpy as np
+
+    ids = vectorstore.index_to_docstore_id
+    if filenames is None:
+        dead = _shard_rows(vectorstore)[1]
+        selector = None
+        if len(dead):
+            # Deleted chunks still in an HNSW graph
+            excluded = faiss.IDSelectorBatch(dead)
+            selector = faiss.IDSelectorNot(excluded)
+        return [(distance, ids[row]) for distance, row in
+                _search_hits(vectorstore, query_vector, k, len(ids), selector, nprobe, ef_search)]
+
+    allowed = _positions_for_sources(vectorstore, filenames)
+    if not allowed:
+        return []
+    selector = faiss.IDSelectorBatch(np.asarray(allowed, dtype=np.int64))
+
+    if faiss_index.index_kind(vectorstore.index) == "flat":
+        # Flat search already scores every allowed row
+        hits = _search_hits(vectorstore, query_vector, k, len(allowed), selector)
+    elif len(allowed) <= SELECTION_EXACT_SHARE * vectorstore.index.ntotal:
+        hits = _selection_hits(vectorstore, query_vector, k, allowed, selector)
+    else:
+        hits = _search_hits(vectorstore, query_vector, k, len(allowed), selector, nprobe, ef_search)
+        if len(hits) < min(k, len(allowed)):
+            # The lists probed / the graph explored held too few selected rows
+            hits = _selection_hits(vectorstore, query_vector, k, allowed, selector)
+    return [(distance, ids[row]) for distance, row in hits]
+
+
+def reciprocal_rank_fusion(rankings, k=None):
+    """Fuse ranked lists of ids into one, best first."""
+    rrf_k = RRF_K if k is None else k
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+def search(query, k=4, sources=None, vectorstore=None, nprobe=None, ef_search=None, hybrid=None,
+           collections=None):
+    """
+    Return the k chunks most relevant to query.
+
+    Args:
+        query (str): Search text
+        k (int): Number of chunks to return
+        sources (list): Optional document selection to restrict the search to
+            (matched like chunk_store.resolve_sources)
+        vectorstore: Optional store to search instead of the collection shards
+        nprobe (int): IVF lists to visit (IVF indexes only)
+        ef_search (int): HNSW candidate list size (HNSW indexes only)
+        hybrid (bool): Fuse vector and BM25 rankings (defaults to HYBRID_SEARCH)
+        collections (list): Optional collections to search (defaults to all)
+
+    Returns:
+        list: LangChain Documents, best match first
+    """
+    import numpy as np
+
+    if vectorstore is not None:
+        names = [getattr(vectorstore, "collection", vector_store.DEFAULT_COLLECTION)]
+    else:
+        names = list(collections) if collections else vector_store.list_collections()
+
+    filenames = None
+    if sources:
+        # The selection may differ in case (or be a path); search the stored filenames
+        filenames = chunk_store.resolve_sources(sources, collections=names)
+        if not filenames:
+            return []
+        if vectorstore is None:
+            # Only the shards that hold the selected documents
+            held = {info['collection'] for info in chunk_store.get_document_index(filenames).values()}
+            names = [name for name in names if name in held]
+
+    shards = [vectorstore] if vectorstore is not None else [vector_store.get_vectorstore(name) for name in names]
+    shards = [shard for shard in shards if shard is not None and shard.index.ntotal]
+    if not shards:
+        return []
+
+    if hybrid is None:
+        hybrid = HYBRID_SEARCH
+    fetch = max(k * HYBRID_CANDIDATES, 20) if hybrid else k
+
+    query_vector = query_cache.embed_query(query)[np.newaxis, :]
+    if len(shards) == 1:
+        hits = _shard_hits(shards[0], query_vector, fetch, filenames, nprobe, ef_search)
+    else:
+        # Scatter to the shards, gather the best fetch by distance
+        per_shard = _search_pool().map(
+            lambda shard: _shard_hits(shard, query_vector, fetch, filenames, nprobe, ef_search), shards)
+        hits = sorted(hit for shard_hits in per_shard for hit in shard_hits)[:fetch]
+    ranking = [vector_id for _, vector_id in hits]
+
+    if hybrid:
+        # BM25 matches that are in the loaded index generations
+        live = [_position_map(shard) for shard in shards]
+        lexical = [vector_id for vector_id in chunk_store.search_text(
+                       query, limit=fetch, filenames=filenames,
+                       collections=None if vectorstore is not None else names)
+                   if any(vector_id in positions for positions in live)]
+        ranking = reciprocal_rank_fusion([ranking, lexical]) if lexical else ranking
+
+    # Chunk text is only read for the hits
+    docs = chunk_store.get_documents(ranking[:k])
+    references = chunk_store.get_references([doc.id for doc in docs])
+    for doc in docs:
+        if doc.id in references:
+            # The same text also appears here (it is indexed once)
+            doc.metadata['duplicate_sources'] = references[doc.id]
+    return docs
+
+
+def warm_query_cache():
+    """Precompute the vectors of the study tools' fixed queries."""
+    return query_cache.precompute(TOOL_QUERIES)
+
+
+def measure_recall(k=10, num_queries=100, vectorstore=None, nprobe=None, ef_search=None):
+    """
+    Recall@k of the current index against exact (flat) search.
+
+    Queries are stored chunk vectors with a little noise added, so no
+    encoder calls are needed. Returns recall with and without re-ranking.
+    """
+    import faiss
+    import numpy as np
+
+    if vectorstore is None:
+        vectorstore = vector_store.get_vectorstore()
+    if vectorstore is None or vectorstore.index.ntotal == 0:
+        return None
+
+    exact_vectors = getattr(vectorstore, "exact_vectors", None)
+    if exact_vectors is None:
+        exact_vectors = faiss_index.all_vectors(vectorstore.index)
+    exact_vectors = np.asarray(exact_vectors, dtype=np.float32)
+
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(exact_vectors), min(num_queries, len(exact_vectors)), replace=False)
+    queries = exact_vectors[picks] + rng.normal(0, 0.01, (len(picks), exact_vectors.shape[1])).astype(np.float32)
+    k = min(k, len(exact_vectors))
+
+    flat = faiss.IndexFlatL2(exact_vectors.shape[1])
+    flat.add(exact_vectors)
+    _, truth = flat.search(queries, k)
+
+    def recall(rerank):
+        hits = 0
+        for query, expected in zip(queries, truth):
+            rows = _search_rows(vectorstore, query[None, :], k, vectorstore.index.ntotal,
+                                nprobe=nprobe, ef_search=ef_search, rerank=rerank)
+            hits += len(set(rows) & set(expected.tolist()))
+        return hits / (len(queries) * k)
+
+    info = vector_store.read_manifest(getattr(vectorstore, "collection", vector_store.DEFAULT_COLLECTION))
+    return {
+        'index_type': info.get('index_type', faiss_index.index_kind(vectorstore.index)),
+        'compression': info.get('compression', 'none'),
+        'k': k,
+        'queries': len(queries),
+        'recall': round(recall(rerank=False), 4),
+        'recall_reranked': round(recall(rerank=True), 4),
+        'index_bytes_per_vector': faiss_index.bytes_per_vector(vectorstore.index)
+    }
@@ -508,6 +508,7 @@ clearMemory.addEventListener('click', async () => {
 // Summarizer
 document.getElementById('summarizeBtn').addEventListener('click', async () => {
     const style = document.getElementById('summaryStyle').value;
+    const documents = getSelectedDocsForSection('summarizer');
     const output = document.getElementById('summaryOutput');
 
     output.textContent = 'Generating summary...';
@@ -516,7 +517,7 @@ document.getElementById('summarizeBtn').addEventListener('click', async () => {
         const response = await fetch(`${API_BASE}/summarize`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ style })
+            body: JSON.stringify({ style, documents })
         });
         const data = await response.json();
         output.innerHTML = marked(data.summary || 'No summary available');
@@ -1,31 +1,23 @@
-import os
-from groq import Groq
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
+import llm
+import retrieval
+import vector_store
 
 load_dotenv()
-DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
 
-def get_summary(style="Bulleted"):
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key: return "GROQ_API_KEY missing. Please add it to your .env file."
-    
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    if not os.path.exists(FAISS_INDEX_PATH): return "No docs found."
+def get_summary(style="Bulleted", selected_docs=None):
+    if not llm.is_configured("groq"): return "GROQ_API_KEY missing. Please add it to your .env file."
     
     try:
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 15})  # Increased from 10 to 15
-        docs = retriever.invoke("core concepts summary main ideas key points details conclusion")
+        if not vector_store.list_collections(): return "No docs found."
+        docs = retrieval.search(retrieval.SUMMARY_QUERY,
+                                k=15, sources=selected_docs)  # Increased from 10 to 15
+        if not docs and selected_docs:
+            return "No indexed content found in the selected documents."
         context_text = "\n".join([d.page_content for d in docs])
     except Exception as e:
         return f"Error: {e}"
 
-    # Initialize Groq client
-    client = Groq(api_key=api_key)
-    
     style_prompt = {
         "Bulleted": "a comprehensive bulleted list with detailed key takeaways, including important details and examples. Each bullet point should be informative and well-explained.",
         "Paragraph": "a detailed narrative summary with multiple paragraphs that thoroughly covers the main topics, supporting details, and key insights",
@@ -47,12 +39,8 @@ def get_summary(style="Bulleted"):
     """
     
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=2000  # Increased token limit for longer summaries
-        )
-        return response.choices[0].message.content
+        return llm.chat("groq", [{"role": "user", "content": prompt}],
+                        temperature=0.3,
+                        max_tokens=2000)  # Increased token limit for longer summaries
     except Exception as e:
         return f"Summary failed: {e}"
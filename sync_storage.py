@@ -1,10 +1,10 @@
 import os
 import sqlite3
 import glob
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+import ingest_pipeline
+import pdf_loader
+import retrieval
+import vector_store
 
 DATA_DIR = "data"
 TEMP_DIR = os.path.join(DATA_DIR, "temp")
@@ -58,58 +58,48 @@ def sync_database_with_files():
     else:
         print("\n✓ No orphaned database entries")
     
+    # Collection of every stored file (files added above are in the default one)
+    cursor.execute('SELECT filename, collection FROM uploads')
+    owners = dict(cursor.fetchall())
     conn.close()
     
-    # Rebuild FAISS index with ALL files
+    # Rebuild each collection's FAISS index with ALL its files
     print(f"\n--- REBUILDING FAISS INDEX ---")
     
+    by_collection = {}
+    for path in pdf_files:
+        by_collection.setdefault(owners.get(os.path.basename(path), vector_store.DEFAULT_COLLECTION), []).append(path)
+    for collection in vector_store.list_collections():
+        if collection not in by_collection:
+            print(f"Clearing {collection} index (no files left)")
+            vector_store.clear_vectorstore(collection)
+    
     if not pdf_files:
         print("No PDF files found")
         return
     
-    documents = []
-    
-    for pdf_path in sorted(pdf_files):
-        filename = os.path.basename(pdf_path)
-        try:
-            print(f"Loading {filename}...")
-            loader = PyPDFLoader(pdf_path)
-            docs = loader.load()
-            documents.extend(docs)
-            print(f"  ✓ {len(docs)} pages loaded")
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
+    for collection, paths in sorted(by_collection.items()):
+        print(f"Indexing {len(paths)} files into {collection} with {pdf_loader.PDF_WORKERS} parse workers...")
+        stats = ingest_pipeline.ingest_files(sorted(paths), replace=True, collection=collection)
+        print(f"  ✓ {stats['pages']} pages, {stats['chunks']} chunks indexed")
+        
+        vectorstore = vector_store.get_vectorstore(collection)
+        if vectorstore is None:
+            print("No documents to index")
             continue
-    
-    if not documents:
-        print("No documents to index")
-        return
-    
-    # Split documents
-    print(f"\nSplitting {len(documents)} pages into chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    splits = text_splitter.split_documents(documents)
-    print(f"  ✓ Created {len(splits)} chunks")
-    
-    # Create FAISS index
-    print("\nCreating FAISS index...")
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_documents(splits, embeddings)
-    vectorstore.save_local(FAISS_INDEX_PATH)
-    print(f"  ✓ FAISS index saved")
-    
-    # Verify index
-    print("\n--- VERIFICATION ---")
-    docs = vectorstore.similarity_search("test", k=100)
-    source_counts = {}
-    for doc in docs:
-        source = doc.metadata.get('source', '')
-        filename = os.path.basename(source)
-        source_counts[filename] = source_counts.get(filename, 0) + 1
-    
-    print(f"\nFAISS index contains {len(docs)} chunks from {len(source_counts)} files:")
-    for filename, count in sorted(source_counts.items()):
-        print(f"  • {filename}: {count} chunks")
+        
+        # Verify index
+        print(f"\n--- VERIFICATION ({collection}) ---")
+        docs = retrieval.search("test", k=100, vectorstore=vectorstore, hybrid=False)
+        source_counts = {}
+        for doc in docs:
+            source = doc.metadata.get('source', '')
+            filename = os.path.basename(source)
+            source_counts[filename] = source_counts.get(filename, 0) + 1
+        
+        print(f"\nFAISS index contains {len(docs)} chunks from {len(source_counts)} files:")
+        for filename, count in sorted(source_counts.items()):
+            print(f"  • {filename}: {count} chunks")
     
     print("\n✓ SYNCHRONIZATION COMPLETE!")
 
@@ -1,4 +1,3 @@
-from gtts import gTTS
 import os
 import tempfile
 
@@ -6,6 +5,8 @@ def speak_text(text):
     if not text:
         return None
     try:
+        from gtts import gTTS
+
         # Create a temp file
         tts = gTTS(text=text, lang='en')
         
@@ -0,0 +1,1017 @@
+"""
+Cached FAISS vector store handle.
+
+Readers (qa, quiz, summarize, flashcards, mindmap) share one in-memory
+vectorstore per process and only reload from disk when a new index
+generation has been published, so steady-state retrieval never touches
+index.faiss.
+
+On disk every generation is a directory data/faiss_index/gen-NNNNNN/ with
+index.faiss (the vectors), ids.npy (FAISS row -> chunk id) and
+manifest.json. A writer fills a fresh directory and then atomically
+replaces data/faiss_index/CURRENT to point at it, so readers never block
+and never see a half-written index. Chunk text and metadata live in the
+chunks table of data/metadata.db (see chunk_store), not in a pickled
+docstore.
+
+All index mutations go through writer_lock(), which serializes writers
+across threads and processes: each one loads the latest generation,
+changes it and publishes the next, so concurrent uploads cannot overwrite
+each other's chunks.
+
+Documents are grouped into named collections (one per course or
+workspace). Each collection is a separate shard with its own generations,
+writer lock and reader cache: the default collection lives in
+data/faiss_index, any other in data/collections/<name>/faiss_index. Every
+function here takes the collection it works on (DEFAULT_COLLECTION if not
+given); a loaded vectorstore remembers its collection, so saving it
+publishes to the right shard.
+
+Each generation's manifest records its chunk count, documents, embedding
+model and build time, and aliases.npy which chunks share a vector in it.
+Chunk rows a new generation drops are retired rather than deleted (see
+chunk_store) while an older generation on disk refers to them, so
+rollback() can make that generation live again with a pointer flip and by
+moving its rows back instead of a rebuild. A publish only touches the rows
+it changes. Generations beyond FAISS_KEEP_GENERATIONS are deleted, and the
+retired rows only they referred to with them.
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within a process
+    fcntl = None
+
+import chunk_store
+import embedding_cache
+import faiss_index
+from embedding_service import EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, get_embeddings
+
+DATA_DIR = "data"
+FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
+COLLECTIONS_DIR = os.path.join(DATA_DIR, "collections")
+DEFAULT_COLLECTION = chunk_store.DEFAULT_COLLECTION
+CURRENT_NAME = "CURRENT"
+WRITER_LOCK_PATH = os.path.join(DATA_DIR, "faiss_index.lock")
+# Monotonic counter the generation numbers are allocated from
+INDEX_VERSION_PATH = os.path.join(DATA_DIR, "index_version")
+MANIFEST_NAME = "manifest.json"
+IDS_NAME = "ids.npy"
+LEGACY_DOCSTORE_NAME = "index.pkl"
+# Readers map the index read-only instead of copying it into each process
+MMAP_READERS = os.getenv("FAISS_MMAP", "1") == "1"
+# Full-precision copy of the vectors of a compressed index, for re-ranking
+EXACT_VECTORS_NAME = "exact_vectors.f32"
+# (chunk id, vector id) of the chunks sharing a vector in a generation, for rolling back to it
+ALIASES_NAME = "aliases.npy"
+# Generation directories kept on disk (the current one included), so a
+# reader that is still opening the previous generation finds it intact
+KEEP_GENERATIONS = max(2, int(os.getenv("FAISS_KEEP_GENERATIONS", "2")))
+
+_COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+_cache_lock = threading.Lock()
+# collection -> (vectorstore, version)
+_cached = {}
+
+
+class _WriterLock:
+    """Re-entrant lock held by one index writer at a time, across processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    @contextmanager
+    def hold(self):
+        with self._lock:
+            if self._depth == 0:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "a")
+                if fcntl is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    # Closing the file releases the flock
+                    self._file.close()
+                    self._file = None
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def check_collection_name(collection):
+    """Raise ValueError unless collection is a usable collection name."""
+    if not isinstance(collection, str) or not _COLLECTION_NAME.match(collection):
+        raise ValueError(f"Invalid collection name: {collection!r} "
+                         "(letters, digits, '-' and '_', at most 64 characters)")
+    return collection
+
+
+def _index_root(collection):
+    if collection == DEFAULT_COLLECTION:
+        return FAISS_INDEX_PATH
+    return os.path.join(COLLECTIONS_DIR, check_collection_name(collection), "faiss_index")
+
+
+def _version_path(collection):
+    if collection == DEFAULT_COLLECTION:
+        return INDEX_VERSION_PATH
+    return os.path.join(COLLECTIONS_DIR, collection, "index_version")
+
+
+def writer_lock(collection=DEFAULT_COLLECTION):
+    """Context manager serializing mutations of one collection's index (re-entrant within a thread)."""
+    with _writers_lock:
+        if collection not in _writers:
+            path = WRITER_LOCK_PATH if collection == DEFAULT_COLLECTION else \
+                os.path.join(COLLECTIONS_DIR, check_collection_name(collection), "faiss_index.lock")
+            _writers[collection] = _WriterLock(path)
+        return _writers[collection].hold()
+
+
+def _generation_dir(root, generation):
+    return os.path.join(root, f"gen-{generation:06d}")
+
+
+def _current_pointer(root):
+    """Name of the live generation directory, or None."""
+    try:
+        with open(os.path.join(root, CURRENT_NAME)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def current_index_path(collection=DEFAULT_COLLECTION):
+    """Directory of the live generation (None if nothing is indexed)."""
+    root = _index_root(collection)
+    pointer = _current_pointer(root)
+    if pointer is None:
+        if os.path.exists(os.path.join(root, "index.faiss")):
+            # Flat layout written by older code; moved into a generation on first load
+            return root
+        return None
+    return os.path.join(root, pointer)
+
+
+def index_exists(collection=DEFAULT_COLLECTION):
+    path = current_index_path(collection)
+    return path is not None and os.path.exists(os.path.join(path, "index.faiss"))
+
+
+def list_collections():
+    """Names of the collections that have a published index, default first."""
+    names = [DEFAULT_COLLECTION] if current_index_path(DEFAULT_COLLECTION) is not None else []
+    if os.path.isdir(COLLECTIONS_DIR):
+        for name in sorted(os.listdir(COLLECTIONS_DIR)):
+            if _COLLECTION_NAME.match(name) and name != DEFAULT_COLLECTION \
+                    and current_index_path(name) is not None:
+                names.append(name)
+    return names
+
+
+def _read_generation(collection):
+    try:
+        with open(_version_path(collection)) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _bump_generation(collection):
+    generation = _read_generation(collection) + 1
+    path = _version_path(collection)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(generation))
+    os.replace(tmp_path, path)
+    return generation
+
+
+def current_version(collection=DEFAULT_COLLECTION):
+    """
+    Cheap token identifying the live generation (None if nothing is indexed).
+
+    The CURRENT pointer only changes when a writer publishes, so a reader
+    compares one small file instead of stat-ing the index.
+    """
+    path = current_index_path(collection)
+    if path is None:
+        return None
+    if path != _index_root(collection):
+        return os.path.basename(path)
+    try:
+        st = os.stat(os.path.join(path, "index.faiss"))
+    except OSError:
+        return None
+    return ("legacy", st.st_mtime_ns, st.st_size)
+
+
+def _publish(generation_dir):
+    """Atomically point CURRENT at a fully written generation directory."""
+    root = os.path.dirname(generation_dir)
+    tmp_path = os.path.join(root, CURRENT_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(os.path.basename(generation_dir))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_NAME))
+
+
+def _generation_dirs(root):
+    """Published generation directories, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if name.startswith("gen-") and not name.endswith(".tmp"))
+
+
+def _collect_garbage(root):
+    """Remove old generations and directories of writers that died mid-write."""
+    current = _current_pointer(root)
+    for name in os.listdir(root):
+        if name.startswith("gen-") and name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    older = [name for name in _generation_dirs(root) if name != current]
+    for name in older[:max(0, len(older) - (KEEP_GENERATIONS - 1))]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _read_ids(path):
+    """Chunk ids of a generation's vectors, as a bytes array ("" for tombstones)."""
+    import numpy as np
+
+    ids_path = os.path.join(path, IDS_NAME)
+    if not os.path.exists(ids_path):
+        return np.zeros(0, dtype="S1")
+    return np.load(ids_path, allow_pickle=False)
+
+
+def _read_aliases(path):
+    """{chunk id: vector id} of a generation's chunks sharing a vector (None if not recorded)."""
+    import numpy as np
+
+    aliases_path = os.path.join(path, ALIASES_NAME)
+    if not os.path.exists(aliases_path):
+        return None
+    pairs = np.load(aliases_path, allow_pickle=False)
+    return {chunk_id.decode(): vector_id.decode() for chunk_id, vector_id in pairs.tolist()}
+
+
+def _write_aliases(path, aliases):
+    """Record the chunks sharing a vector ({chunk id: vector id}) in a generation being written."""
+    import numpy as np
+
+    pairs = np.array(list(aliases.items()), dtype="S").reshape(-1, 2)
+    with open(os.path.join(path, ALIASES_NAME), "wb") as f:
+        np.save(f, pairs, allow_pickle=False)
+
+
+def _purge_retired(collection):
+    """Delete the retired chunk rows no generation left on disk refers to."""
+    import numpy as np
+
+    retired = chunk_store.get_retired_ids(collection)
+    if not retired:
+        return 0
+    candidates = np.array(retired, dtype="S")
+    referenced = np.zeros(len(candidates), dtype=bool)
+    root = _index_root(collection)
+    for name in _generation_dirs(root):
+        path = os.path.join(root, name)
+        referenced |= np.isin(candidates, _read_ids(path))
+        aliases = _read_aliases(path)
+        if aliases:
+            referenced |= np.isin(candidates, np.array(list(aliases), dtype="S"))
+    return chunk_store.purge_retired([chunk_id.decode() for chunk_id in candidates[~referenced].tolist()])
+
+
+def _migrate_flat_layout(collection):
+    """Move an index saved directly in the collection's index directory into a generation directory."""
+    root = _index_root(collection)
+    with writer_lock(collection):
+        if _current_pointer(root) is not None or not os.path.exists(os.path.join(root, "index.faiss")):
+            return
+        target = _generation_dir(root, _bump_generation(collection))
+        os.makedirs(target)
+        for name in ("index.faiss", IDS_NAME, LEGACY_DOCSTORE_NAME, MANIFEST_NAME, EXACT_VECTORS_NAME):
+            source = os.path.join(root, name)
+            if os.path.exists(source):
+                os.replace(source, os.path.join(target, name))
+        _write_aliases(target, chunk_store.get_alias_map(collection))
+        _publish(target)
+        print(f"[VectorStore] Moved index into {os.path.basename(target)}")
+
+
+def _migrate_legacy_index(path, collection):
+    """
+    Convert an index saved with FAISS.save_local (pickled docstore) into
+    ids.npy + rows in the chunks table. Runs once, on first load.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    with writer_lock(collection):
+        if os.path.exists(os.path.join(path, IDS_NAME)):
+            return
+        print("[VectorStore] Migrating pickled docstore to SQLite chunk store...")
+        legacy = FAISS.load_local(path, get_embeddings(), allow_dangerous_deserialization=True)
+        chunk_store.save_chunks(dict(legacy.docstore._dict), collection)
+        _write_ids(legacy, path)
+        os.remove(os.path.join(path, LEGACY_DOCSTORE_NAME))
+        print(f"[VectorStore] Migrated {len(legacy.docstore._dict)} chunks")
+
+
+def _write_ids(vectorstore, path):
+    import numpy as np
+
+    # Tombstones (deleted rows still in an HNSW graph) are stored as ""
+    ids = [vectorstore.index_to_docstore_id.get(pos, "") for pos in range(vectorstore.index.ntotal)]
+    tmp_path = os.path.join(path, IDS_NAME + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.array(ids, dtype="S"), allow_pickle=False)
+    os.replace(tmp_path, os.path.join(path, IDS_NAME))
+
+
+class _RowIds(Mapping):
+    """Read-only FAISS row -> chunk id view over a memory-mapped ids.npy (tombstones left out)"""
+
+    def __init__(self, array):
+        self._array = array
+        self._tombstones = None
+
+    def __getitem__(self, pos):
+        if not 0 <= pos < len(self._array) or not self._array[pos]:
+            raise KeyError(pos)
+        return self._array[pos].decode()
+
+    def tombstones(self):
+        import numpy as np
+
+        if self._tombstones is None:
+            self._tombstones = np.flatnonzero(self._array == b"").astype(np.int64)
+        return self._tombstones
+
+    def __len__(self):
+        return len(self._array) - len(self.tombstones())
+
+    def __iter__(self):
+        if not len(self.tombstones()):
+            return iter(range(len(self._array)))
+        return (pos for pos in range(len(self._array)) if self._array[pos])
+
+
+def _read_index(path, mmap):
+    import faiss
+
+    if mmap:
+        # Flat/SQ/PQ codes and IVF lists are mapped instead of copied, so
+        # workers on one node share page cache. Never mutate such an index:
+        # faiss aborts on writes to a viewed buffer.
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"[VectorStore] mmap load failed ({e}), reading into memory")
+    return faiss.read_index(path)
+
+
+def load_vectorstore(mmap=False, collection=DEFAULT_COLLECTION):
+    """
+    Load the live generation of a collection from disk.
+
+    With mmap=False this is a private, mutable copy for writers. With
+    mmap=True the index, row ids and exact vectors are memory-mapped
+    read-only: startup cost no longer depends on index size.
+    """
+    import numpy as np
+    from langchain_community.vectorstores import FAISS
+
+    if _current_pointer(_index_root(collection)) is None and index_exists(collection):
+        _migrate_flat_layout(collection)
+    path = current_index_path(collection)
+    if path is None or not os.path.exists(os.path.join(path, "index.faiss")):
+        return None
+    if not os.path.exists(os.path.join(path, IDS_NAME)):
+        _migrate_legacy_index(path, collection)
+
+    index = _read_index(os.path.join(path, "index.faiss"), mmap)
+    ids_path = os.path.join(path, IDS_NAME)
+    if mmap:
+        index_to_docstore_id = _RowIds(np.load(ids_path, mmap_mode="r", allow_pickle=False))
+    else:
+        ids = np.load(ids_path, allow_pickle=False)
+        index_to_docstore_id = {pos: chunk_id.decode() for pos, chunk_id in enumerate(ids.tolist()) if chunk_id}
+
+    vectorstore = FAISS(
+        embedding_function=get_embeddings(),
+        index=index,
+        docstore=chunk_store.SQLiteDocstore(collection),
+        index_to_docstore_id=index_to_docstore_id
+    )
+    vectorstore.exact_vectors = _open_exact_vectors(vectorstore.index, path)
+    vectorstore.generation = os.path.basename(path)
+    vectorstore.collection = collection
+    _check_embedding_compatibility(path)
+    return vectorstore
+
+
+def _check_embedding_compatibility(path):
+    """
+    Warn when the index was built by a different embedding model.
+
+    A different backend (torch / onnx / onnx-int8) of the same model shares
+    the vector space, so that alone never requires a reindex.
+    """
+    built_with = _manifest_at(path).get("embedding_model")
+    if built_with and built_with != EMBEDDING_MODEL_NAME:
+        print(f"[VectorStore] WARNING: index was built with {built_with}, queries use "
+              f"{EMBEDDING_MODEL_NAME}; rebuild the index (POST /api/index/rebuild)")
+
+
+def _open_exact_vectors(index, path):
+    """Memory-map the exact vectors of a compressed index (None if absent)."""
+    import numpy as np
+
+    path = os.path.join(path, EXACT_VECTORS_NAME)
+    if not os.path.exists(path) or os.path.getsize(path) != index.ntotal * index.d * 4:
+        return None
+    if index.ntotal == 0:
+        return None
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(index.ntotal, index.d))
+
+
+def get_vectorstore(collection=DEFAULT_COLLECTION):
+    """
+    Return the shared read-only vectorstore of a collection, or None if
+    nothing is indexed in it.
+
+    Callers must not mutate the returned object (it is memory-mapped
+    read-only when FAISS_MMAP=1); mutations go through IndexAppender,
+    delete_document() and build_vectorstore().
+    """
+    version = current_version(collection)
+    store, cached_version = _cached.get(collection, (None, None))
+    if store is not None and version == cached_version:
+        return store
+
+    with _cache_lock:
+        version = current_version(collection)
+        if version is None:
+            _cached.pop(collection, None)
+            return None
+        store, cached_version = _cached.get(collection, (None, None))
+        if store is None or version != cached_version:
+            print(f"[VectorStore] Loading {collection} index {version}")
+            try:
+                store = load_vectorstore(mmap=MMAP_READERS, collection=collection)
+            except (OSError, RuntimeError) as e:
+                # The generation was replaced and collected while we opened it
+                print(f"[VectorStore] Reload raced with a writer ({e}), retrying")
+                store = load_vectorstore(mmap=MMAP_READERS, collection=collection)
+            cached_version = current_version(collection) if store is None else getattr(store, "generation", version)
+            _cached[collection] = (store, cached_version)
+        return store
+
+
+def _manifest_at(path):
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_manifest(collection=DEFAULT_COLLECTION):
+    """Build info for the current index of a collection (type, training size, ...)."""
+    path = current_index_path(collection)
+    if path is None:
+        return {}
+    return _manifest_at(path)
+
+
+def tombstones(vectorstore):
+    """Sorted FAISS rows of deleted chunks still in an index that cannot remove them (HNSW)."""
+    import numpy as np
+
+    ids = vectorstore.index_to_docstore_id
+    if len(ids) == vectorstore.index.ntotal:
+        return np.zeros(0, dtype=np.int64)
+    if isinstance(ids, _RowIds):
+        return ids.tombstones()
+    return np.setdiff1d(np.arange(vectorstore.index.ntotal, dtype=np.int64),
+                        np.fromiter(ids.keys(), dtype=np.int64, count=len(ids)))
+
+
+def _ordered_texts(vectorstore):
+    ids = [vectorstore.index_to_docstore_id.get(pos) for pos in range(vectorstore.index.ntotal)]
+    texts = {doc.id: doc.page_content for doc in chunk_store.get_documents([i for i in ids if i])}
+    # Tombstones get a placeholder; they are never searched and dropped on the next rebuild
+    return [texts.get(chunk_id, "") for chunk_id in ids]
+
+
+def stored_vectors(vectorstore):
+    """
+    Exact vectors in FAISS row order.
+
+    Compressed indexes use their exact vectors, kept row-aligned by the
+    writer; only when those are missing (re-ranking was off) are the texts
+    read back through the embedding cache.
+    """
+    if faiss_index.is_compressed(vectorstore.index):
+        exact_vectors = getattr(vectorstore, "exact_vectors", None)
+        if exact_vectors is not None and len(exact_vectors) == vectorstore.index.ntotal:
+            return exact_vectors
+        return embedding_cache.embed_documents(_ordered_texts(vectorstore))
+    return faiss_index.all_vectors(vectorstore.index)
+
+
+def _set_exact_vectors(vectorstore, vectors):
+    """Keep the exact vectors of a writer's index (rows as in the index; None when not compressed)."""
+    import numpy as np
+
+    compressed = faiss_index.is_compressed(vectorstore.index) and faiss_index.RERANK_FACTOR > 0
+    vectorstore.exact_vectors = np.asarray(vectors, dtype=np.float32) if compressed else None
+
+
+def _write_exact_vectors(vectorstore, path):
+    import numpy as np
+
+    if not faiss_index.is_compressed(vectorstore.index) or faiss_index.RERANK_FACTOR <= 0:
+        return
+    np.asarray(stored_vectors(vectorstore), dtype=np.float32).tofile(os.path.join(path, EXACT_VECTORS_NAME))
+
+
+def save_vectorstore(vectorstore, info=None, documents=None, aliases=None):
+    """
+    Write an index as a new generation of its collection and publish it.
+
+    The generation directory is filled under a temporary name and renamed
+    when complete; only then is CURRENT flipped to it. documents are the
+    filenames indexed in it; without them the live generation's are kept.
+    aliases ({chunk id: vector id}) are the chunks sharing a vector once it
+    is live; without them the chunk rows are taken as they are.
+    """
+    import faiss
+
+    collection = getattr(vectorstore, "collection", DEFAULT_COLLECTION)
+    root = _index_root(collection)
+    with writer_lock(collection):
+        generation = _bump_generation(collection)
+        final_path = _generation_dir(root, generation)
+        path = final_path + ".tmp"
+        os.makedirs(path)
+
+        faiss.write_index(vectorstore.index, os.path.join(path, "index.faiss"))
+        _write_ids(vectorstore, path)
+        _write_exact_vectors(vectorstore, path)
+        _write_aliases(path, chunk_store.get_alias_map(collection) if aliases is None else aliases)
+        manifest = dict(info) if info is not None else read_manifest(collection)
+        manifest.setdefault("index_type", faiss_index.index_kind(vectorstore.index))
+        manifest["chunk_count"] = len(vectorstore.index_to_docstore_id)
+        manifest["tombstones"] = vectorstore.index.ntotal - manifest["chunk_count"]
+        manifest["generation"] = generation
+        manifest["embedding_model"] = EMBEDDING_MODEL_NAME
+        manifest["embedding_backend"] = EMBEDDING_BACKEND
+        manifest["dim"] = vectorstore.index.d
+        manifest["collection"] = collection
+        manifest["built_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        if documents is None:
+            documents = read_manifest(collection).get("documents")
+        if documents is None:
+            # Only generations written before the list was kept up to date lack it
+            documents = chunk_store.get_filenames(vectorstore.index_to_docstore_id.values())
+        manifest["documents"] = sorted(documents)
+        with open(os.path.join(path, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(path, final_path)
+        _publish(final_path)
+        _collect_garbage(root)
+        _purge_retired(collection)
+
+    print(f"[VectorStore] Saved {collection} index generation {generation} "
+          f"({manifest['index_type']}, {manifest['chunk_count']} chunks)")
+    return generation
+
+
+def clear_vectorstore(collection=DEFAULT_COLLECTION):
+    """Unpublish a collection's index (no documents left in it)."""
+    root = _index_root(collection)
+    with writer_lock(collection):
+        live_ids = _live_ids(collection)
+        pointer = os.path.join(root, CURRENT_NAME)
+        if os.path.exists(pointer):
+            os.remove(pointer)
+        if os.path.exists(os.path.join(root, "index.faiss")):
+            shutil.rmtree(root)
+        elif os.path.isdir(root):
+            _collect_garbage(root)
+        _bump_generation(collection)
+        shared = [alias for aliases in chunk_store.get_aliases(live_ids).values() for alias in aliases]
+        # Retired, so the generation being left can be rolled back to
+        chunk_store.retire_chunks(live_ids + shared)
+        _purge_retired(collection)
+
+
+def list_generations(collection=DEFAULT_COLLECTION):
+    """Generations of a collection on disk, newest first, with their manifests."""
+    root = _index_root(collection)
+    current = _current_pointer(root)
+    generations = []
+    for name in reversed(_generation_dirs(root)):
+        path = os.path.join(root, name)
+        manifest = _manifest_at(path)
+        info = {key: value for key, value in manifest.items() if key != "documents"}
+        info.update({
+            'generation': int(name[len("gen-"):]),
+            'documents': len(manifest.get("documents", [])),
+            'current': name == current,
+            'restorable': name == current or os.path.exists(os.path.join(path, ALIASES_NAME))
+        })
+        generations.append(info)
+    return generations
+
+
+def rollback(generation=None, collection=DEFAULT_COLLECTION):
+    """
+    Make an earlier generation of a collection live again and restore the
+    chunk rows it refers to. Without a generation number, the newest one
+    before the live one is used. Returns its manifest.
+
+    Only the index and chunk rows change; see ingest.rollback_index() for
+    reconciling the uploads list with the documents of that generation.
+
+    Raises ValueError if the generation is not on disk or its chunk rows
+    cannot be restored.
+    """
+    root = _index_root(collection)
+    with writer_lock(collection):
+        current = _current_pointer(root)
+        names = _generation_dirs(root)
+        if generation is None:
+            earlier = [name for name in names if current is None or name < current]
+            if not earlier:
+                raise ValueError("No earlier index generation to roll back to")
+            name = earlier[-1]
+        else:
+            name = os.path.basename(_generation_dir(root, int(generation)))
+            if name not in names:
+                raise ValueError(f"Index generation {generation} is not on disk")
+        path = os.path.join(root, name)
+        if name == current:
+            return _manifest_at(path)
+
+        live_ids = _live_ids(collection)
+        aliases = _read_aliases(path)
+        if aliases is None:
+            raise ValueError(f"Index generation {name} has no record of its chunks to restore")
+        target_ids = [chunk_id.decode() for chunk_id in _read_ids(path).tolist() if chunk_id]
+        chunk_store.restore_chunk_set(live_ids, target_ids, aliases)
+        _publish(path)
+
+    print(f"[VectorStore] Rolled {collection} index back to {name}")
+    return _manifest_at(path)
+
+
+def _wrap_index(index, ids, vectors, collection=DEFAULT_COLLECTION):
+    from langchain_community.vectorstores import FAISS
+
+    vectorstore = FAISS(
+        embedding_function=get_embeddings(),
+        index=index,
+        docstore=chunk_store.SQLiteDocstore(collection),
+        index_to_docstore_id=dict(enumerate(ids))
+    )
+    vectorstore.collection = collection
+    _set_exact_vectors(vectorstore, vectors)
+    return vectorstore
+
+
+def _reshape_index(vectorstore, index_type=None):
+    """
+    Rebuild the FAISS structure from the vectors already stored in it
+    (retraining centroids or switching type). Nothing is re-embedded.
+    """
+    vectors = stored_vectors(vectorstore)
+    positions = sorted(vectorstore.index_to_docstore_id)
+    ids = [vectorstore.index_to_docstore_id[pos] for pos in positions]
+
+    index_type = faiss_index.choose_index_type(len(ids), index_type,
+                                               current=faiss_index.index_kind(vectorstore.index))
+    vectors = vectors[positions]
+    index, info = faiss_index.build_index(vectors, index_type)
+    vectorstore.index = index
+    vectorstore.index_to_docstore_id = dict(enumerate(ids))
+    _set_exact_vectors(vectorstore, vectors)
+    print(f"[VectorStore] Rebuilt {info['index_type']} index over {len(ids)} stored vectors")
+    return info
+
+
+def _remove_by_refill(vectorstore, ids=()):
+    """Drop rows (and any tombstones) from an index by refilling it, keeping its training."""
+    removed = set(ids)
+    keep = [pos for pos, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+            if doc_id not in removed]
+    vectors = stored_vectors(vectorstore)[keep]
+    vectorstore.index = faiss_index.refill_index(vectorstore.index, vectors)
+    _set_exact_vectors(vectorstore, vectors)
+    vectorstore.index_to_docstore_id = {
+        new_pos: vectorstore.index_to_docstore_id[old_pos] for new_pos, old_pos in enumerate(keep)
+    }
+
+
+def _maybe_retrain(vectorstore, info):
+    live = len(vectorstore.index_to_docstore_id)
+    if live and faiss_index.needs_retrain(vectorstore.index, info, live):
+        return _reshape_index(vectorstore)
+    return info
+
+
+def _live_ids(collection=DEFAULT_COLLECTION):
+    """Chunk ids of the live generation, read straight from ids.npy."""
+    path = current_index_path(collection)
+    if path is None:
+        return []
+    return [chunk_id.decode() for chunk_id in _read_ids(path).tolist() if chunk_id]
+
+
+def _append_rows(vectorstore, ids, vectors):
+    import numpy as np
+
+    start = vectorstore.index.ntotal
+    if getattr(vectorstore, "exact_vectors", None) is not None or (
+            faiss_index.is_compressed(vectorstore.index) and faiss_index.RERANK_FACTOR > 0):
+        # Extend the exact vectors alongside the index instead of re-deriving them from the texts
+        _set_exact_vectors(vectorstore, np.concatenate([stored_vectors(vectorstore), vectors]))
+    vectorstore.index.add(vectors)
+    vectorstore.index_to_docstore_id.update({start + offset: chunk_id for offset, chunk_id in enumerate(ids)})
+
+
+def _drop_rows(vectorstore, ids):
+    """
+    Remove rows from a loaded index in place (flat, IVF) or leave them as
+    tombstones (HNSW, rebuilt once they pass FAISS_HNSW_MAX_TOMBSTONES).
+
+    The chunk rows stay until the new generation is live; they are retired
+    (not deleted) then, so the one being superseded can be rolled back to.
+    """
+    import numpy as np
+
+    removed = set(ids)
+    rows = [pos for pos, doc_id in vectorstore.index_to_docstore_id.items() if doc_id in removed]
+    if not faiss_index.supports_remove(vectorstore.index):
+        for pos in rows:
+            del vectorstore.index_to_docstore_id[pos]
+        if len(tombstones(vectorstore)) > faiss_index.HNSW_MAX_TOMBSTONES * vectorstore.index.ntotal:
+            _remove_by_refill(vectorstore)
+        return
+    if getattr(vectorstore, "exact_vectors", None) is not None:
+        # The exact vectors lose the same rows
+        vectorstore.exact_vectors = np.delete(vectorstore.exact_vectors, rows, axis=0)
+    faiss_index.remove_rows(vectorstore.index, rows)
+    vectorstore.index_to_docstore_id = dict(enumerate(
+        doc_id for _, doc_id in sorted(vectorstore.index_to_docstore_id.items()) if doc_id not in removed))
+
+
+def merge_rows(vectorstore, merges):
+    """
+    Fold chunks into the vector of a near-duplicate and publish the result.
+
+    merges is {chunk id: id of the chunk whose vector it shares from now on}.
+    The merged chunks keep their rows (text, page, FTS entry) but lose their
+    FAISS row; chunks already sharing a merged chunk's vector follow it.
+    Call under the collection's writer_lock() with its latest generation loaded.
+    """
+    _drop_rows(vectorstore, list(merges))
+    vector_ids = dict(merges)
+    for owner, aliases in chunk_store.get_aliases(merges).items():
+        vector_ids.update({alias: merges[owner] for alias in aliases})
+    aliases = chunk_store.get_alias_map(vectorstore.collection)
+    aliases.update(vector_ids)
+    save_vectorstore(vectorstore, _maybe_retrain(vectorstore, read_manifest(vectorstore.collection)),
+                     aliases=aliases)
+    chunk_store.set_vector_ids(vector_ids)
+    return len(merges)
+
+
+class IndexAppender:
+    """
+    Incremental index writer: batches of chunks are appended as they are
+    embedded and the index is published once, on commit().
+
+    Chunk rows are written per batch, so callers never hold the corpus
+    text; only the batch vectors are kept until commit. The writer lock is
+    taken just for commit, which loads the latest generation at that point,
+    so appends made by other writers in the meantime are kept. With
+    replace=True the batches become the whole index (chunks of the previous
+    generation are dropped once the new one is live). remove_filenames are
+    documents whose existing chunks are dropped in the same commit, so a
+    batch of deletes and uploads publishes a single generation.
+
+    A chunk whose text is already indexed (or appears earlier in the batch)
+    does not get a vector of its own; it shares the existing one (see
+    chunk_store). When the owner of a shared vector is removed, one of the
+    chunks sharing it takes the vector over. deduplicated counts the chunks
+    of this commit that share a vector.
+
+    Everything happens in one collection; a replace only replaces that
+    collection's index.
+    """
+
+    def __init__(self, replace=False, index_type=None, remove_filenames=(), collection=DEFAULT_COLLECTION):
+        self.collection = check_collection_name(collection)
+        self.replace = replace
+        self.index_type = index_type
+        self.remove_filenames = list(remove_filenames)
+        self.ids = []
+        self.filenames = set()
+        self.removed = 0
+        self.deduplicated = 0
+        self.published = False
+        self._pending = []
+
+    def append(self, splits, vectors):
+        import numpy as np
+
+        ids = chunk_store.new_chunk_ids(splits)
+        chunk_store.save_chunks(dict(zip(ids, splits)), self.collection)
+        self._pending.append(np.asarray(vectors, dtype=np.float32))
+        self.ids.extend(ids)
+        self.filenames.update(chunk_store.source_filename(doc) for doc in splits)
+
+    def commit(self):
+        """Publish the changes; returns the new vectorstore (None if nothing is indexed)."""
+        if not self.ids and not self.remove_filenames:
+            return None
+
+        with writer_lock(self.collection):
+            vectorstore = None if self.replace else load_vectorstore(collection=self.collection)
+            replaced_ids = _live_ids(self.collection) if self.replace else []
+            kept = set(self.ids)
+
+            # Earlier chunks of removed documents (a re-upload's own new rows stay)
+            stale_ids = [chunk_id for filename in self.remove_filenames
+                         for chunk_id in chunk_store.get_chunk_ids(filename) if chunk_id not in kept]
+            if vectorstore is not None and stale_ids:
+                indexed_ids = set(vectorstore.index_to_docstore_id.values())
+                present = [chunk_id for chunk_id in stale_ids if chunk_id in indexed_ids]
+                self.removed = len(present)
+                if present and len(present) == len(vectorstore.index_to_docstore_id):
+                    vectorstore = None
+                elif present:
+                    _drop_rows(vectorstore, present)
+
+            indexed = set(vectorstore.index_to_docstore_id.values()) if vectorstore is not None else set()
+            new_ids, vectors, vector_ids = self._deduplicate(indexed, stale_ids)
+            documents = self._documents()
+            aliases = self._aliases(vector_ids, stale_ids)
+
+            if new_ids:
+                if vectorstore is not None and vectorstore.index.d != vectors.shape[1]:
+                    raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index "
+                                     f"({vectorstore.index.d}); rebuild the index for the new model")
+                if vectorstore is not None:
+                    _append_rows(vectorstore, new_ids, vectors)
+                    info = _maybe_retrain(vectorstore, read_manifest(self.collection))
+                else:
+                    index, info = faiss_index.build_index(vectors, self.index_type)
+                    vectorstore = _wrap_index(index, new_ids, vectors, self.collection)
+                save_vectorstore(vectorstore, info, documents, aliases)
+                self.published = True
+            elif self.removed or self.ids:
+                # No new vectors, but documents left or arrived (sharing existing vectors)
+                if vectorstore is None:
+                    clear_vectorstore(self.collection)
+                else:
+                    save_vectorstore(vectorstore, _maybe_retrain(vectorstore, read_manifest(self.collection)),
+                                     documents, aliases)
+                self.published = True
+            chunk_store.set_vector_ids(vector_ids)
+
+            # Chunks of the previous index are only dropped once the new one is live,
+            # and kept as retired rows while an older generation refers to them
+            replaced_ids = [chunk_id for chunk_id in replaced_ids if chunk_id not in kept]
+            replaced_ids += [alias for aliases in chunk_store.get_aliases(replaced_ids).values()
+                             for alias in aliases if alias not in kept]
+            chunk_store.retire_chunks(stale_ids + replaced_ids)
+
+        self._pending = []
+        return vectorstore
+
+    def _documents(self):
+        """Filenames indexed once this commit is live (the previous generation's, updated)."""
+        if self.replace:
+            return set(self.filenames)
+        previous = read_manifest(self.collection).get("documents")
+        if previous is None:
+            return None
+        return (set(previous) - set(self.remove_filenames)) | self.filenames
+
+    def _aliases(self, vector_ids, stale_ids):
+        """{chunk id: vector id} of the chunks sharing a vector once this commit is live."""
+        aliases = {} if self.replace else chunk_store.get_alias_map(self.collection)
+        aliases.update(vector_ids)
+        stale = set(stale_ids)
+        return {chunk_id: vector_id for chunk_id, vector_id in aliases.items()
+                if vector_id is not None and chunk_id not in stale}
+
+    def _deduplicate(self, indexed, stale_ids):
+        """
+        Decide which chunks get a vector of their own.
+
+        indexed holds the ids with a vector in the index being committed to,
+        stale_ids the chunks being removed. Returns (ids to append, their
+        vectors, {chunk id: vector id it shares, or None once it owns one}).
+        """
+        import numpy as np
+
+        vector_ids = {}
+
+        # Removed owners hand their vector to a surviving duplicate
+        stale = set(stale_ids)
+        heirs = []
+        for aliases in chunk_store.get_aliases(stale).values():
+            survivors = [alias for alias in aliases if alias not in stale]
+            if survivors:
+                heirs.append(survivors[0])
+                vector_ids[survivors[0]] = None
+                vector_ids.update({alias: survivors[0] for alias in survivors[1:]})
+        new_ids = list(heirs)
+        rows = []
+        if heirs:
+            texts = [doc.page_content for doc in chunk_store.get_documents(heirs)]
+            rows.extend(np.asarray(embedding_cache.embed_documents(texts), dtype=np.float32))
+        owner_of = {digest: heir for heir, digest in chunk_store.get_hashes(heirs).items()}
+
+        hashes = chunk_store.get_hashes(self.ids)
+        for digest, owners in chunk_store.find_vector_owners(hashes.values()).items():
+            live = [owner for owner in owners if owner in indexed]
+            if live:
+                owner_of.setdefault(digest, live[0])
+
+        pending = np.vstack(self._pending) if self._pending else None
+        for position, chunk_id in enumerate(self.ids):
+            digest = hashes.get(chunk_id)
+            owner = owner_of.setdefault(digest, chunk_id) if digest else chunk_id
+            if owner != chunk_id:
+                vector_ids[chunk_id] = owner
+                self.deduplicated += 1
+                continue
+            new_ids.append(chunk_id)
+            rows.append(pending[position])
+
+        return new_ids, np.vstack(rows) if rows else None, vector_ids
+
+    def abort(self):
+        """
+        Drop the chunk rows written so far (the index on disk is untouched).
+
+        Once commit() has published a generation its rows are live and stay.
+        """
+        if not self.published:
+            chunk_store.forget_chunks(self.ids)
+        self.ids = []
+        self._pending = []
+
+
+def build_vectorstore(splits, index_type=None, collection=DEFAULT_COLLECTION):
+    """
+    Replace a collection's whole index with one built from these chunks.
+
+    The index type is picked from the chunk count unless FAISS_INDEX_TYPE
+    (or index_type) forces one.
+    """
+    appender = IndexAppender(replace=True, index_type=index_type, collection=collection)
+    appender.append(splits, embedding_cache.embed_documents([doc.page_content for doc in splits]))
+    return appender.commit()
+
+
+def delete_document(filename, collection=DEFAULT_COLLECTION):
+    """
+    Remove one document's vectors from its collection's index and the docstore.
+
+    Returns the number of chunks removed. Only that document's ids are
+    touched; the rest of the corpus is neither re-parsed nor re-embedded.
+    """
+    appender = IndexAppender(remove_filenames=[filename], collection=collection)
+    appender.commit()
+    print(f"[VectorStore] Removed {appender.removed} chunks of {filename}")
+    return appender.removed
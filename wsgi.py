@@ -0,0 +1,43 @@
+"""
+WSGI entry point for production: gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app (see gunicorn.conf.py) this module is imported once, in
+the gunicorn master, before the workers are forked. preload() loads the
+embedding model and every collection's memory-mapped index there, so the
+workers share those pages instead of each loading a copy. init_worker()
+runs in each worker after the fork.
+"""
+
+import os
+import time
+
+import embedding_service
+import job_queue
+import retrieval
+import vector_store
+from app import app
+
+
+def preload():
+    """Load the model and the live indexes before the workers are forked."""
+    started = time.perf_counter()
+    os.makedirs('data/temp', exist_ok=True)
+    embedding_service.warmup()
+    collections = vector_store.list_collections()
+    for collection in collections:
+        vector_store.get_vectorstore(collection)
+    print(f"[Server] Preloaded the embedding model and {len(collections)} index(es) "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+def init_worker(encoder_threads):
+    """Per-worker setup, after the fork."""
+    embedding_service.set_threads(encoder_threads)
+    # Encoding only starts here: thread pools created before a fork are not
+    # safe to use in the children
+    retrieval.warm_query_cache()
+    # recover_interrupted_jobs() assumes no other process is running jobs
+    job_queue.start_workers_in_one_process()
+
+
+preload()